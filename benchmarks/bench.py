@@ -0,0 +1,429 @@
+'''
+benchmarks for the client hot paths, results are printed (or written with --output) as JSON so runs can be compared
+across releases
+
+    python benchmarks/bench.py                       # everything
+    python benchmarks/bench.py --quick -f from_id    # smaller runs, only benchmarks with "from_id" in the name
+    python benchmarks/bench.py --output results.json
+
+micro benchmarks use an in-process api that hands out prebuilt dicts so only our own code is timed, the end to end
+ones (names starting with e2e_) run against ssCore's FakeSpotifyServer on localhost. every benchmark runs --repeat
+times from a fresh state, best and median are reported. a few untimed checks (see checks) run first, the exit
+status is 1 if one of them fails
+'''
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import *
+
+import numpy as np
+
+import simplespotify
+from simplespotify import globalstate as gs
+from simplespotify.UserClasses import Artist, Album, Track, Playlist
+from simplespotify.audioanalysis import AudioAnalysis
+from simplespotify.crawler import RelatedArtistsCrawler
+from simplespotify.sinks import JSONLSink
+from simpleSpotifyCore.IDtools import get_id, is_id, SpotifyID, parse_ids, validate_ids
+from simpleSpotifyCore.api import SimpleSpotifyApi
+from simpleSpotifyCore.tokenbearers import Client, DirectTokenBearer
+from simpleSpotifyCore.fakeserver import FakeCatalog, FakeSpotifyServer
+
+benchmarks = []
+
+
+def benchmark(name: str, ops: int):
+    ''' registers func(scale) -> (setup, run), run() does ops * scale operations and is what gets timed '''
+    def register(func):
+        benchmarks.append((name, ops, func))
+        return func
+    return register
+
+
+def measure(name: str, ops: int, setup: Callable, run: Callable, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {"name": name, "ops": ops, "repeat": repeat, "best_s": best, "median_s": statistics.median(times),
+            "us_per_op": best / ops * 1e6, "ops_per_s": ops / best}
+
+
+# -- fixtures --
+
+_catalog = None
+
+
+def catalog() -> FakeCatalog:
+    global _catalog
+    if _catalog is None:
+        _catalog = FakeCatalog.synthetic(artists=200, albums_per_artist=5, seed=0)
+    return _catalog
+
+
+def simplified_track(track: dict) -> dict:
+    return {key: value for key, value in track.items() if key not in ("album", "popularity", "external_ids")}
+
+
+class CatalogApi:
+    ''' answers the endpoints the object layer uses straight from the catalog, no http '''
+
+    def __init__(self, catalog: FakeCatalog):
+        self.catalog = catalog
+
+    def single_track(self, id, market=None):
+        return self.catalog.tracks[id]
+
+    def multiple_tracks(self, ids, market=None):
+        return {"tracks": [self.catalog.tracks.get(id) for id in ids]}
+
+    def single_artist(self, id):
+        return self.catalog.artists[id]
+
+    def multiple_artists(self, ids):
+        return {"artists": [self.catalog.artists.get(id) for id in ids]}
+
+
+class Bearer:
+    def __init__(self, api):
+        self.api = api
+
+
+def reset_caches():
+    for itemcls in (Artist, Album, Track, Playlist):
+        itemcls.cache.clear()
+        if "_loader" in itemcls.__dict__:
+            del itemcls._loader
+
+
+def use_catalog_api():
+    gs.use_globally(Bearer(CatalogApi(catalog())))
+
+
+# -- object construction --
+
+def _init_benchmark(full: bool):
+    def factory(scale):
+        dicts = list(catalog().tracks.values())[:5000 * scale]
+        if not full:
+            dicts = [simplified_track(track) for track in dicts]
+
+        def setup():
+            use_catalog_api()
+            reset_caches()
+
+        def run():
+            for apidict in dicts:
+                Track(apidict)
+        return setup, run
+    return factory
+
+
+benchmark("item_init_simplified", 5000)(_init_benchmark(full=False))
+benchmark("item_init_full", 5000)(_init_benchmark(full=True))
+
+
+def _dict_if_cached_benchmark(hot: bool):
+    def factory(scale):
+        dicts = [simplified_track(track) for track in list(catalog().tracks.values())[:5000 * scale]]
+
+        def setup():
+            use_catalog_api()
+            reset_caches()
+            if hot:
+                Track._dict_if_cached(dicts)
+
+        def run():
+            Track._dict_if_cached(dicts)
+        return setup, run
+    return factory
+
+
+benchmark("dict_if_cached_cold", 5000)(_dict_if_cached_benchmark(hot=False))
+benchmark("dict_if_cached_hot", 5000)(_dict_if_cached_benchmark(hot=True))
+
+
+def _from_id_benchmark(bulk: bool, hot: bool):
+    def factory(scale):
+        ids = list(catalog().tracks)[:2000 * scale]
+
+        def setup():
+            use_catalog_api()
+            reset_caches()
+            if hot:
+                Track.from_id(ids)
+
+        def run():
+            if bulk:
+                Track.from_id(ids)
+            else:
+                for id in ids:
+                    Track.from_id(id)
+        return setup, run
+    return factory
+
+
+benchmark("from_id_single_cold", 2000)(_from_id_benchmark(bulk=False, hot=False))
+benchmark("from_id_single_hot", 2000)(_from_id_benchmark(bulk=False, hot=True))
+benchmark("from_id_list_cold", 2000)(_from_id_benchmark(bulk=True, hot=False))
+benchmark("from_id_list_hot", 2000)(_from_id_benchmark(bulk=True, hot=True))
+
+
+@benchmark("from_search_cache_hit", 10000)
+def from_search_hits(scale):
+    names = [track["name"] for track in list(catalog().tracks.values())[:10000 * scale]]
+
+    def setup():
+        use_catalog_api()
+        reset_caches()
+        Track.from_id(list(catalog().tracks)[:10000 * scale])
+
+    def run():
+        for name in names:
+            Track.from_search(name)
+    return setup, run
+
+
+# -- ids --
+
+def _id_benchmark(form: str, func):
+    def factory(scale):
+        ids = list(catalog().tracks)[:10000 * scale]
+        values = {"id": ids, "uri": [f"spotify:track:{id}" for id in ids],
+                  "url": [f"https://open.spotify.com/track/{id}" for id in ids]}[form]
+
+        def run():
+            for value in values:
+                func(value)
+        return (lambda: None), run
+    return factory
+
+
+for _form in ("id", "uri", "url"):
+    benchmark(f"get_id_{_form}", 10000)(_id_benchmark(_form, get_id))
+benchmark("is_id", 10000)(_id_benchmark("id", is_id))
+benchmark("spotify_id", 10000)(_id_benchmark("id", SpotifyID))
+
+
+def _bulk_id_benchmark(func):
+    def factory(scale):
+        ids = list(catalog().tracks)
+        ids = (ids * (100000 * scale // len(ids) + 1))[:100000 * scale]
+        return (lambda: None), (lambda: func(ids))
+    return factory
+
+
+benchmark("parse_ids_bulk", 100000)(_bulk_id_benchmark(parse_ids))
+benchmark("validate_ids_bulk", 100000)(_bulk_id_benchmark(validate_ids))
+
+
+# -- request overhead --
+
+class _InstantResponse:
+    status_code = 200
+    headers = {}
+    content = b"{}"
+
+    def json(self):
+        return {}
+
+
+class _InstantSession:
+    ''' answers every request immediately so only the client side of _get is timed '''
+
+    def get(self, url, **kwargs):
+        return _InstantResponse()
+
+
+def _request_benchmark(bearer_factory):
+    def factory(scale):
+        api = SimpleSpotifyApi(bearer_factory(), session=_InstantSession())
+
+        def run():
+            for _ in range(10000 * scale):
+                api._get(f"{api.base_url}/tracks/0000000000000000000000")
+        return (lambda: None), run
+    return factory
+
+
+def _client_bearer():
+    bearer = Client("id", "secret")
+    bearer._tokeninfo = {"access_token": "token", "expires_at": int(time.time()) + 3600}
+    return bearer
+
+
+benchmark("request_overhead_direct_token", 10000)(_request_benchmark(lambda: DirectTokenBearer("token", makesession=False)))
+benchmark("request_overhead_client_token", 10000)(_request_benchmark(_client_bearer))
+
+
+# -- end to end against the fake server --
+
+_server = None
+
+
+def server() -> FakeSpotifyServer:
+    global _server
+    if _server is None:
+        _server = FakeSpotifyServer(catalog()).start()
+        playlist = next(iter(catalog().playlists))
+        catalog().playlist_tracks[playlist] = list(catalog().tracks)[:10000]
+    return _server
+
+
+def _fake_client():
+    return simplespotify.Client("id", "secret", **server().urls).use_globally()
+
+
+@benchmark("e2e_playlist_paging", 10000)
+def playlist_paging(scale):
+    playlist = next(iter(catalog().playlists))
+
+    def setup():
+        _fake_client()
+        reset_caches()
+
+    def run():
+        for _ in range(scale):
+            for _ in gs.get_current_api().iter_playlist_tracks(playlist):
+                pass
+    return setup, run
+
+
+@benchmark("e2e_from_id_bulk", 2000)
+def from_id_bulk(scale):
+    ids = list(catalog().tracks)[:2000 * scale]
+
+    def setup():
+        _fake_client()
+        reset_caches()
+
+    def run():
+        Track.from_id(ids)
+    return setup, run
+
+
+@benchmark("e2e_related_artists_crawl", 200)
+def related_crawl(scale):
+    seed = next(iter(catalog().artists))
+    path = os.path.join(tempfile.gettempdir(), "simplespotify-bench-edges.jsonl")
+
+    def run():
+        _fake_client()
+        with JSONLSink(path) as sink:
+            crawler = RelatedArtistsCrawler([seed], sink, depth=None, limit=200 * scale, concurrency=8)
+            crawler.run()
+            crawler.close()
+    return (lambda: None), run
+
+
+# -- checks --
+# not timed, they make sure what's being benchmarked still holds up, main() fails if one doesn't
+
+def check_cache_bounds() -> Optional[str]:
+    ''' evicted items have to be collected, nothing (the HydrationLoader's pending items...) may keep them alive '''
+    use_catalog_api()
+    reset_caches()
+    Track.cache.configure(max_entries=100)
+    try:
+        tracks = list(catalog().tracks.values())[:3000]
+        for apidict in tracks[:1500]:
+            Track(simplified_track(apidict))  # simplified, waits in the loader for hydration
+        for apidict in tracks[1500:]:
+            Track(apidict)
+        gc.collect()
+        alive = sum(isinstance(obj, Track) for obj in gc.get_objects())
+        if alive > 100:
+            return f"{alive} Track objects alive with Track.cache limited to 100"
+        return None
+    finally:
+        Track.cache.configure()
+        reset_caches()
+
+
+def check_audio_analysis_missing_fields() -> Optional[str]:
+    ''' fields missing or null in some items, and short pitch vectors, are NaN and don't shift the rest of the column '''
+    document = {"sections": [{"start": 0.0, "duration": 1.0, "time_signature": None},
+                             {"start": 1.0, "duration": 2.0, "time_signature": 4}],
+                "segments": [{"start": 0.0, "pitches": [0.5] * 11, "timbre": [1.0] * 12},
+                             {"start": 1.0, "pitches": [0.25] * 12, "timbre": [2.0] * 12}]}
+    analysis = AudioAnalysis.parse("0" * 22, io.BytesIO(json.dumps(document).encode()))
+    sections, segments = analysis.sections, analysis.segments
+    lengths = {f"{name}.{column}": len(values) for name, columns in (("sections", sections), ("segments", segments))
+               for column, values in columns.items()}
+    if set(lengths.values()) != {2}:
+        return f"columns of different lengths: {lengths}"
+    if not (np.isnan(sections["time_signature"][0]) and sections["time_signature"][1] == 4
+            and np.isnan(sections["confidence"]).all() and sections["start"].tolist() == [0.0, 1.0]):
+        return f"sections parsed as {sections}"
+    if analysis.pitches.shape != (2, 12) or not np.isnan(analysis.pitches[0]).all() or analysis.pitches[1, 0] != 0.25 \
+            or analysis.timbre[1, 0] != 2.0:
+        return f"pitches parsed as {analysis.pitches}"
+    return None
+
+
+checks = [check_cache_bounds, check_audio_analysis_missing_fields]
+
+
+# -- running --
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-f", "--filter", help="only run benchmarks with this in their name")
+    parser.add_argument("-o", "--output", help="write the results here instead of stdout")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="one repeat at half the size, for a quick check")
+    args = parser.parse_args(argv)
+
+    scale, repeat = (1, 1) if args.quick else (2, args.repeat)
+    failures = {check.__name__: failure for check in checks if (failure := check()) is not None}
+    for name, failure in failures.items():
+        print(f"{name} failed: {failure}", file=sys.stderr)
+    results = []
+    try:
+        for name, ops, factory in benchmarks:
+            if args.filter and args.filter not in name:
+                continue
+            setup, run = factory(scale)
+            result = measure(name, ops * scale, setup, run, repeat)
+            results.append(result)
+            print(f"{name:36} {result['us_per_op']:12.2f} us/op {result['ops_per_s']:14.0f} ops/s", file=sys.stderr)
+    finally:
+        if _server is not None:
+            _server.stop()
+
+    report = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "commit": _commit(),
+                       "python": platform.python_version(), "implementation": platform.python_implementation(),
+                       "platform": platform.platform(), "scale": scale},
+              "failed_checks": failures,
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
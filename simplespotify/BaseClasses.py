@@ -1,31 +1,57 @@
 import abc
+import asyncio
 from . import globalstate as gs
-from simpleSpotifyCore.IDtools import get_id,is_id
+from simpleSpotifyCore.IDtools import get_id,is_id, SpotifyID
+from .loader import HydrationLoader
+from .itemcache import ItemCache
+
+
+def _trim(apidict: dict, keys: tuple):
+    """ removes keys from apidict and every dict nested in it """
+    if not isinstance(apidict, dict):  # typed records from fast_decode never had them
+        return
+    for key in keys:
+        apidict.pop(key, None)
+    for value in apidict.values():
+        if isinstance(value, dict):
+            _trim(value, keys)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    _trim(item, keys)
 
 
 class SpotifyItem (abc.ABC):
     """ Base class for all types of object we should have (track, album, and artist).
         user should never use or see this its just for inheritance"""
 
-    cache = {
-        'names': {},
-        'ids': {},
-        'searches': {}
-    }
+    # no per instance __dict__, every subclass lists its own attributes
+    __slots__ = ("_apidict", "url", "id", "uri", "name", "type", "href", "_form", "_fields", "__weakref__")
+
+    # what happens to _apidict once it's been parsed : None keeps all of it, "trim" removes _trimmed_keys
+    # (available_markets is most of a track), "drop" throws it away and get_apidict() fetches it again if needed
+    compact = None
+    _trimmed_keys = ("available_markets",)
+
+    # every subclass gets its own, see ItemCache.configure for limiting how much it keeps
+    cache = ItemCache()
 
     _api = property(fget=gs.get_current_api)
+    _async_api = property(fget=gs.get_current_async_api)
+
+    # (api method, response key) of the multiple_* endpoint for this type, None if there isn't one
+    _multiple_endpoint = None
+
+    # attribute -> where it is in the api dict, items built from a projection set the ones they have data for
+    _field_paths = {"url": ("external_urls", "spotify"), "id": ("id",), "uri": ("uri",), "name": ("name",),
+                    "type": ("type",), "href": ("href",)}
 
     def __init__(self, apidict: dict):
 
-        # track, artist and album all have these so far
         self._apidict: dict = apidict
+        self._fields = None  # top level fields we hold, None unless built from a projection
 
-        self.url:   str = self._apidict['external_urls']['spotify']
-        self.id:    str = self._apidict['id']
-        self.uri:   str = self._apidict['uri']
-        self.name:  str = self._apidict['name']
-        self.type:  str = self._apidict['type']
-        self.href:  str = self._apidict['href']
+        self._add_base_attrs()
 
         # store the item in cache
         self._cache()
@@ -33,15 +59,140 @@ class SpotifyItem (abc.ABC):
         self._add_simple_attrs()
         if self._form == 'full' :
             self._add_full_attrs()
+            self._notify_hydrated()
+        elif self._multiple_endpoint is not None :
+            self._get_loader().defer(self)
+        self._compact()
+
+    def _add_base_attrs(self):
+        # track, artist and album all have these so far
+        self.url:   str = self._apidict['external_urls']['spotify']
+        self.id:    str = self._apidict['id']
+        self.uri:   str = self._apidict['uri']
+        self.name:  str = self._apidict['name']
+        self.type:  str = self._apidict['type']
+        self.href:  str = self._apidict['href']
+
+    @classmethod
+    def _from_projection(cls, apidict: dict, count: bool = True):
+        """
+        an item from a response cut down with a fields filter. only the attributes in _field_paths it has data for
+        are set, reading any other one fetches what's missing (see _fetch_missing) and parses the rest.
+        apidict needs the id for that, without one the item can't be completed or cached. count as in _from_dict
+        """
+        if apidict is None:
+            return None
+        if 'id' in apidict:
+            ids = cls.cache['ids']
+            existing = ids.get(apidict['id']) if count else ids.peek(apidict['id'])
+            if existing is not None:
+                return existing
+        item = cls.__new__(cls)
+        item._apidict = apidict
+        item._fields = frozenset(apidict.keys())
+        item._form = "projected"
+        for attr, path in cls._field_paths.items():
+            value = apidict
+            for key in path:
+                if value is None or key not in value:
+                    break
+                value = value[key]
+            else:
+                setattr(item, attr, value)
+        if 'id' not in apidict:
+            return item
+        item._cache()
+        if cls._multiple_endpoint is not None:
+            cls._get_loader().defer(item)
+        return cls.cache['ids'].peek(item.id, item)
+
+    def _fetch_missing(self):
+        """ completes a projected item, only playlists take a fields filter so the rest fetch the whole thing """
+        cls = self.__class__
+        if cls._multiple_endpoint is not None:
+            cls._get_loader().load(self)
+        else:
+            self._hydrate(getattr(self._api, "single_" + cls.__name__.lower())(self.id))
+
+    def _compact(self):
+        if self.__class__.compact == "drop":
+            self._apidict = None
+        elif self.__class__.compact == "trim":
+            _trim(self._apidict, self._trimmed_keys)
+
+    def get_apidict(self) -> dict:
+        """ the dictionary from the spotify api, fetched again in full form if compact mode dropped it """
+        if self._apidict is None:
+            apidict = getattr(self._api, "single_" + self.__class__.__name__.lower())(self.id)
+            if self._form != "full":
+                self._hydrate(apidict)
+            self._apidict = apidict
+        return self._apidict
+
+    @classmethod
+    def _get_loader(cls) -> HydrationLoader:
+        # every class gets its own loader, created the first time it's needed
+        if "_loader" not in cls.__dict__:
+            cls._loader = HydrationLoader(cls)
+        return cls._loader
+
+    @classmethod
+    def hydrate(cls, items: list) -> list:
+        """
+        fetches the full form of every simplified item in items using as few multiple_* calls as possible,
+        items can be a mix of types. returns items
+        """
+        by_class = {}
+        for item in items:
+            by_class.setdefault(item.__class__, []).append(item)
+        for itemcls, group in by_class.items():
+            if itemcls._multiple_endpoint is None:
+                for item in group:
+                    if item._form != "full":
+                        item._get_full_attribute("id")
+            else:
+                itemcls._get_loader().hydrate(group)
+        return items
+
+    def _hydrate(self, apidict: dict):
+        self._apidict = apidict
+        if self._form == "projected":
+            # only the projected fields were set, parse everything else now that we have it
+            self._fields = None
+            self._add_base_attrs()
+            self._add_simple_attrs()
+        self._add_full_attrs()
+        self._form = "full"
+        self._notify_hydrated()
+        self._compact()
+
+    @classmethod
+    def on_hydrate(cls, callback):
+        """ callback(item) is called every time an item of this class is built or filled in with its full form """
+        if "_hydration_listeners" not in cls.__dict__:
+            cls._hydration_listeners = []
+        cls._hydration_listeners.append(callback)
+        return callback
+
+    def _notify_hydrated(self):
+        for callback in getattr(self.__class__, "_hydration_listeners", ()):
+            callback(self)
 
 
     def _cache(self):
-        self.__class__.cache["ids"][self.id] = self
-        self.__class__.cache["names"][self.name.strip().lower()] = self
+        # if another thread cached this id first it keeps its place, _from_dict hands that one out
+        if self.__class__.cache["ids"].setdefault(self.id, self) is self and (self._fields is None or 'name' in self._fields):
+            self.__class__.cache["names"][self.name.strip().lower()] = self
 
     def __getattr__(self,attr):
+        # only called for attributes that aren't set
         if attr in self.__class__._full_attr_names :
             return self._get_full_attribute("_"+attr)
+        if attr != "_form" and self._form == "projected" and hasattr(self.__class__, attr):
+            # a slot the projection didn't have data for
+            self._fetch_missing()
+            if self._form != "projected":
+                return getattr(self, attr)
         if hasattr(super(), "__getattr__"):
             return super().__getattr__(attr)
         raise AttributeError(f'No Attribute "{attr}" for {self.__class__.__name__} "{self}"')
@@ -59,53 +210,109 @@ class SpotifyItem (abc.ABC):
         """
         constructor for creating from spotify id,
         IE Artist.from_id('sdfsadfsa')
-        can actually take ID, URI or URL since all have id in them
+        can actually take ID, URI, URL or SpotifyID since all have id in them
 
         """
 
-        if type(id) == str:
+        if isinstance(id, (str, SpotifyID)):
             id = get_id(id)
             if not is_id(id) :
                 return None
             return cls._if_id_cached( id, returnbool=False)
 
         if type(id) == list:
-            if len(id) < 1:
-                return []
+            ids = [get_id(individual_id) for individual_id in id]
 
-            not_cached_items = []
-            cached_items = []
+            found = {individual_id: item for individual_id in ids
+                     if (item := cls.cache['ids'].get(individual_id)) is not None}
+            not_cached_items = [individual_id for individual_id in dict.fromkeys(ids)
+                                if individual_id not in found and is_id(individual_id)]
 
-            for individual_id in id:
-                individual_id = get_id(individual_id)
-                cached = cls._if_id_cached(individual_id, returnbool=True)
-                if cached is False:
-                    not_cached_items.append(individual_id)
-                else:
-                    cached_items.append(cached)
+            if len(not_cached_items) > 0 :
+                found.update(zip(not_cached_items, cls._api_multiple(not_cached_items)))
+            # same order as the input, None for anything spotify didn't know
+            return [found.get(individual_id) for individual_id in ids]
 
-            if len(not_cached_items) < 1 :
-                return cached_items
-            return cls._api_multiple(not_cached_items) + cached_items
+        raise Exception('From_id input must be either a string ID or a list of IDs')
+
+    @classmethod
+    async def from_id_async(cls, id):
+        """
+        async version of from_id, uses the async api so many lookups can run at once
+        """
+        if isinstance(id, (str, SpotifyID)):
+            id = get_id(id)
+            if not is_id(id):
+                return None
+            return await cls._if_id_cached_async(id)
+
+        if type(id) == list:
+            ids = [get_id(individual_id) for individual_id in id]
+
+            found = {individual_id: item for individual_id in ids
+                     if (item := cls.cache['ids'].get(individual_id)) is not None}
+            not_cached_items = [individual_id for individual_id in dict.fromkeys(ids)
+                                if individual_id not in found and is_id(individual_id)]
+
+            if len(not_cached_items) > 0:
+                found.update(zip(not_cached_items, await cls._api_multiple_async(not_cached_items)))
+            return [found.get(individual_id) for individual_id in ids]
 
         raise Exception('From_id input must be either a string ID or a list of IDs')
 
     def _get_full_attribute(self, attribute: str):
         cls = self.__class__
+        if self._form == "projected":
+            try:
+                return object.__getattribute__(self, attribute)
+            except AttributeError:
+                self._fetch_missing()
+        if self._form == "simplified" and cls._multiple_endpoint is not None:
+            # batched with every other simplified item of this class waiting to be hydrated
+            cls._get_loader().load(self)
         if self._form == "simplified":
-            self._apidict = getattr(self._api,"single_"+cls.__name__.lower())(self.id)
-            self._add_full_attrs()
-            self._form = "full"
+            self._hydrate(getattr(self._api,"single_"+cls.__name__.lower())(self.id))
         return getattr(self, attribute)
 
+    @classmethod
+    def _from_dict(cls, dictionary: dict, count: bool = True):
+        '''
+        the cached object for this dict if there is one, otherwise a new one. count=False when the caller has
+        already counted its own cache lookup for this id so it doesn't show up in the stats twice
+        '''
+        if dictionary is None:
+            return None
+        ids = cls.cache['ids']
+        existing = ids.get(dictionary['id']) if count else ids.peek(dictionary['id'])
+        if existing is not None:
+            return existing
+        item = cls(dictionary)
+        # whoever got into the cache first wins if two threads built the same item at once
+        return ids.peek(item.id, item)
+
+    @classmethod
+    def _api_multiple(cls, ids: list) -> list:
+        ''' fetches ids with the multiple_* endpoint, returns objects in the same order with None for unknown ids '''
+        if cls._multiple_endpoint is None:
+            return [cls._if_id_cached(id) for id in ids]
+        return cls._get_loader().fetch(ids)
+
+    @classmethod
+    async def _api_multiple_async(cls, ids: list) -> list:
+        if cls._multiple_endpoint is None:
+            return list(await asyncio.gather(*(cls._if_id_cached_async(id) for id in ids)))
+        method, key = cls._multiple_endpoint
+        return [cls._from_dict(d, count=False) for d in (await getattr(cls._async_api.fget(), method)(ids))[key]]
+
     @classmethod
     def _dict_if_cached(cls, dictlist:list) -> list :
         existing = []
         new = []
         for dictionary in dictlist :
-            if dictionary['id'] in cls.cache['ids'] :
-                existing.append(cls.cache['ids'][dictionary['id']])
-            else : new.append(cls(dictionary))
+            cached = cls.cache['ids'].get(dictionary['id'])
+            if cached is not None :
+                existing.append(cached)
+            else : new.append(cls._from_dict(dictionary, count=False))
         return new + existing
 
     @classmethod
@@ -116,11 +323,24 @@ class SpotifyItem (abc.ABC):
 
         """
 
-        if id in cls.cache['ids'] :
-            return cls.cache['ids'][id]
+        cached = cls.cache['ids'].get(id)
+        if cached is not None :
+            return cached
         if returnbool :
             return False
-        return cls(getattr(cls._api.fget(),"single_"+cls.__name__.lower())(id))
+        if cls._multiple_endpoint is not None :
+            return cls._get_loader().fetch([id])[0]
+        return cls._from_dict(getattr(cls._api.fget(),"single_"+cls.__name__.lower())(id), count=False)
+
+    @classmethod
+    async def _if_id_cached_async(cls, id: str):
+        cached = cls.cache['ids'].get(id)
+        if cached is not None:
+            return cached
+        if cls._multiple_endpoint is not None:
+            return await cls._get_loader().fetch_async(id)
+        # another task may have built it while we were waiting, _from_dict checks again
+        return cls._from_dict(await getattr(cls._async_api.fget(), "single_" + cls.__name__.lower())(id), count=False)
 
     def __str__(self) -> str:
         return self.name
@@ -130,6 +350,7 @@ class SpotifyItem (abc.ABC):
 
 
 class Searchable(abc.ABC) :
+    __slots__ = ()
 
     @classmethod
     def from_search(cls: SpotifyItem, searchstring: str):
@@ -158,3 +379,29 @@ class Searchable(abc.ABC) :
 
         else:
             return None
+
+    @classmethod
+    async def from_search_async(cls: SpotifyItem, searchstring: str):
+        """
+        async version of from_search
+        """
+        stripped = searchstring.lower().strip()
+        if stripped in cls.cache['names']:
+            return cls.cache['names'][stripped]
+        if stripped in cls.cache['searches']:
+            return cls.cache['searches'][stripped]
+
+        results = await cls._async_api.fget().search(q=cls.__name__.lower() + ':' + searchstring,
+                                                     types=cls.__name__.lower(), limit=1)
+        results = results[cls.__name__.lower() + "s"]["items"]
+
+        if len(results) > 0:
+            result = results[0]
+            if result['id'] in cls.cache['ids']:
+                return cls.cache['ids'][result['id']]
+            newitem = cls(result)
+            cls.cache['searches'][searchstring] = newitem
+            return newitem
+
+        else:
+            return None
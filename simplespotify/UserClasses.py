@@ -1,6 +1,9 @@
 
-from copy import deepcopy
+from typing import *
+from simpleSpotifyCore.IDtools import get_id, is_id
 from .BaseClasses import SpotifyItem, Searchable
+from .itemcache import ItemCache
+from .trackcollection import TrackCollection, _track_fields, _build_track
 from . import globalstate as gs
 
 
@@ -45,12 +48,18 @@ class Artist(Searchable, SpotifyItem):
 
     """
 
-    cache = deepcopy(SpotifyItem.cache)
+    __slots__ = ("_albums", "_related_artists", "_top_tracks",
+                 "_followers", "_genres", "_images", "_popularity")
+
+    cache = ItemCache()
+    _multiple_endpoint = ("multiple_artists", "artists")
 
     _full_attr_names = (  "followers",
                           "genres",
                           "images",
                           "popularity",)
+    _field_paths = {**SpotifyItem._field_paths, "_followers": ("followers", "total"), "_genres": ("genres",),
+                    "_images": ("images",), "_popularity": ("popularity",)}
 
     # ['external_urls', 'followers', 'genres', 'href', 'id', 'images', 'name', 'popularity', 'type', 'uri']
     def _add_simple_attrs(self):
@@ -77,9 +86,36 @@ class Artist(Searchable, SpotifyItem):
         --INCLUDES FEATURES AND SINGLES-------------
         """
         if self._albums is None:
-            self._albums = Album._dict_if_cached(self._api.get_artist_albums(self.id)['items'])
+            # every page, not just the first 20 albums
+            self._albums = Album._dict_if_cached(list(self._api.iter_artist_albums(self.id)))
         return self._albums
 
+    def full_discography(self, include_groups: Optional[str] = None, market: Optional[str] = None) -> list:
+        """
+        every album of the artist in full form with its whole tracklist, no duplicates
+            include_groups - any of "album,single,appears_on,compilation", all of them if None
+        album pages are fetched in parallel, then the albums are hydrated 20 at a time with multiple_albums (also in
+        parallel) and only the tracklists longer than the 50 tracks a full album comes with are paged in
+        """
+        api = self._api
+        dicts = {apidict['id']: apidict for apidict in api.iter_artist_albums(self.id, include_groups=include_groups,
+                                                                              market=market)}
+        albums = [Album._from_dict(apidict) for apidict in dicts.values()]
+
+        simplified = [album for album in albums if album._form != "full"]
+        if simplified:
+            loader = Album._get_loader()
+            for album, apidict in zip(simplified, api.multiple_albums([album.id for album in simplified],
+                                                                      market=market)["albums"]):
+                if apidict is not None:
+                    loader.discard(album.id)
+                    album._hydrate(apidict)
+
+        long = [album for album in albums if album._form == "full" and len(album._tracks) < album._total_tracks]
+        for album, tracks in zip(long, api._map(lambda album: list(api.iter_album_tracks(album.id, market=market)), long)):
+            album._tracks = [Track._from_dict(apidict) for apidict in tracks]
+        return albums
+
     def top_tracks(self,market:str="US") -> list:
         if self._top_tracks is None:
             self._top_tracks = Track._dict_if_cached(self._api.artist_top_tracks(self.id,market=market)["tracks"])
@@ -90,9 +126,30 @@ class Artist(Searchable, SpotifyItem):
             self._related_artists = Artist._dict_if_cached(self._api.artist_related_artists(self.id)['artists'])
         return self._related_artists
 
+    async def get_catalog_async(self) -> list:
+        if self._albums is None:
+            self._albums = Album._dict_if_cached([album async for album in self._async_api.iter_artist_albums(self.id)])
+        return self._albums
+
+    async def top_tracks_async(self, market: str = "US") -> list:
+        if self._top_tracks is None:
+            self._top_tracks = Track._dict_if_cached(
+                (await self._async_api.artist_top_tracks(self.id, market=market))["tracks"])
+        return self._top_tracks
+
+    async def related_artists_async(self) -> list:
+        if self._related_artists is None:
+            self._related_artists = Artist._dict_if_cached(
+                (await self._async_api.artist_related_artists(self.id))['artists'])
+        return self._related_artists
+
 
 class Album(Searchable, SpotifyItem):
-    cache = deepcopy(SpotifyItem.cache)
+    __slots__ = ("album_type", "images", "artists", "release_date", "release_date_precision",
+                 "_external_ids", "_genres", "_label", "_copyright", "_popularity", "_total_tracks", "_tracks")
+
+    cache = ItemCache()
+    _multiple_endpoint = ("multiple_albums", "albums")
     _full_attr_names =  (   "total_tracks",
                             "external_ids",
                             "genres",
@@ -100,6 +157,10 @@ class Album(Searchable, SpotifyItem):
                             "copyright",
                             "popularity",
                             "tracks",)
+    _field_paths = {**SpotifyItem._field_paths, "album_type": ("album_type",), "images": ("images",),
+                    "release_date": ("release_date",), "release_date_precision": ("release_date_precision",),
+                    "_external_ids": ("external_ids",), "_genres": ("genres",), "_label": ("label",),
+                    "_copyright": ("copyrights",), "_popularity": ("popularity",), "_total_tracks": ("total_tracks",)}
 
         # ['album_type', 'artists', 'available_markets', 'copyrights', 'external_ids', 'external_urls', 'genres', 'href', 'id', 'images', 'label', 'name', 'popularity', 'release_date', 'release_date_precision', 'total_tracks', 'tracks', 'type', 'uri']
     def _add_simple_attrs(self):
@@ -141,17 +202,30 @@ class Album(Searchable, SpotifyItem):
         releases = gs.get_current_api().get_new_releases(country=country, limit=limit, offset=offset)
         return Album._dict_if_cached(releases['items'])
 
+    @staticmethod
+    async def new_releases_async(country=None, limit=20, offset=0):
+
+        releases = await gs.get_current_async_api().get_new_releases(country=country, limit=limit, offset=offset)
+        return Album._dict_if_cached(releases['items'])
+
     def __len__(self):
         return self._total_tracks
 
 
 class Track(Searchable,SpotifyItem):
-    cache = deepcopy(SpotifyItem.cache)
+    __slots__ = ("artists", "disc_number", "duration_ms", "is_explicit", "preview", "track_number", "is_local",
+                 "_album", "_popularity", "_markets")
+
+    cache = ItemCache()
+    _multiple_endpoint = ("multiple_tracks", "tracks")
     _full_attr_names =  (
         "album",
         "popularity",
         "markets",
     )
+    _field_paths = {**SpotifyItem._field_paths, "disc_number": ("disc_number",), "duration_ms": ("duration_ms",),
+                    "is_explicit": ("explicit",), "preview": ("preview_url",), "track_number": ("track_number",),
+                    "is_local": ("is_local",), "_popularity": ("popularity",)}
 
 
     def _add_simple_attrs(self):
@@ -187,21 +261,77 @@ class Track(Searchable,SpotifyItem):
         self._popularity = self._apidict['popularity']
         # self._markets = self._apidict['available_markets']
 
+    @staticmethod
+    def audio_features_bulk(tracks: list):
+        """ the audio features of tracks (objects or ids) as an AudioFeatureMatrix, needs numpy """
+        from .audiofeatures import AudioFeatureMatrix
+        return AudioFeatureMatrix.fetch(tracks)
+
     def __len__(self) :
         return self.duration_ms
 
 
 class Playlist(SpotifyItem, Searchable):
+    __slots__ = ("isCollaborative", "images", "owner", "isPublic", "snapid", "tracks", "length",
+                 "_description", "_followers")
 
     _full_attr_names = (
-        "collaborative"
-        "description"
-        "followers"
+        "description",
+        "followers",
     )
+    _field_paths = {**SpotifyItem._field_paths, "isCollaborative": ("collaborative",), "images": ("images",),
+                    "owner": ("owner",), "isPublic": ("public",), "snapid": ("snapshot_id",),
+                    "length": ("tracks", "total"), "_description": ("description",), "_followers": ("followers", "total")}
+    # every top level field of a full playlist, _fetch_missing asks for the ones a projection left out
+    _api_fields = ("collaborative", "description", "external_urls", "followers", "href", "id", "images", "name",
+                   "owner", "public", "snapshot_id", "tracks", "type", "uri")
 
-    cache = deepcopy(SpotifyItem.cache)
+    cache = ItemCache()
 
-    # TODO: ADD SUPPORT FOR FIELDS WHEN CONSTRUCTION FROM ID
+    @classmethod
+    def from_id(cls, id, fields: Optional[str] = None):
+        """
+        same as SpotifyItem.from_id, fields is spotify's fields filter e.g. "name,owner(display_name),tracks.total"
+        to only download part of the playlist. anything else is fetched the first time it's read
+        """
+        if fields is None:
+            return super().from_id(id)
+        if type(id) == list:
+            return [cls.from_id(individual_id, fields) for individual_id in id]
+        id = get_id(id)
+        if not is_id(id):
+            return None
+        cached = cls.cache['ids'].get(id)
+        if cached is not None:
+            return cached
+        return cls._from_projection(cls._api.fget().single_playlist(id, fields=fields + ",id"), count=False)
+
+    @classmethod
+    def _from_projection(cls, apidict: dict, count: bool = True):
+        item = super()._from_projection(apidict, count)
+        if item is not None and item._form == "projected" and 'id' in apidict:
+            # tracks page in on their own, reading them doesn't need the rest of the playlist
+            item.tracks = TrackCollection(item.id, first_page=apidict.get("tracks"))
+        return item
+
+    def _fetch_missing(self):
+        # only ask for the top level fields the projection left out, nested projections are kept as they came
+        apidict = dict(self._apidict)
+        apidict.update(self._api.single_playlist(
+            self.id, fields=",".join(field for field in self._api_fields if field not in self._fields)))
+        self._hydrate(apidict)
+
+    def track_page(self, limit: int = 100, offset: int = 0, fields: Optional[str] = None,
+                   market: Optional[str] = None) -> list:
+        """
+        one page of the playlist's tracks as Track objects (episodes, local files and removed tracks are skipped). fields picks
+        which track fields to download in spotify's syntax relative to the track e.g. "name,duration_ms,artists(name)",
+        the rest of a track is fetched the first time it's read
+        """
+        page = self._api.playlist_tracks(self.id, fields=_track_fields(fields), limit=limit, offset=offset,
+                                         market=market)
+        tracks = (_build_track(item, projected=fields is not None) for item in page['items'])
+        return [track for track in tracks if track is not None]
 
     def _add_simple_attrs(self):
         self.isCollaborative = self._apidict["collaborative"]
@@ -209,14 +339,14 @@ class Playlist(SpotifyItem, Searchable):
         self.owner = self._apidict["owner"]  # a USER object
         self.isPublic = self._apidict["public"]
         self.snapid = self._apidict["snapshot_id"]
-        self.tracks = self._apidict["tracks"]
+        self.tracks = TrackCollection(self.id, first_page=self._apidict["tracks"])
         self.length = self._apidict["tracks"]["total"]
 
     def _determine_form(self) :
-        if getattr(self, "_description", -1) is -1 :  # if playlist description is actually "-1" is this fucked?
-            self._form = "simplified"
-        else:
+        if "followers" in self._apidict:  # simplified playlists don't have followers
             self._form = "full"
+        else:
+            self._form = "simplified"
 
     def _add_full_attrs(self):
         self._description = self._apidict["description"]
@@ -1,4 +1,9 @@
 
 from .UserClasses import Artist, Album, Track, Playlist
+from .trackcollection import TrackCollection
 from .globalstate import use_globally
 from .auth import Client, Oauth2
+from simpleSpotifyCore.transport import Transport, HttpxTransport, set_default_transport
+from simpleSpotifyCore.instrumentation import Instrumentation, StatsRecorder, SpanRecorder, OpenTelemetryInstrumentation, \
+    MultiInstrumentation, set_default_instrumentation
+from simpleSpotifyCore.IDtools import SpotifyID
@@ -0,0 +1,125 @@
+import os
+from array import array
+import ijson
+import numpy as np
+from . import globalstate as gs
+
+# the columns kept for every list in an audio analysis, pitches and timbre are kept as segments x 12 matrices
+interval_columns = ("start", "duration", "confidence")
+analysis_columns = {
+    "bars": interval_columns,
+    "beats": interval_columns,
+    "tatums": interval_columns,
+    "sections": interval_columns + ("loudness", "tempo", "key", "mode", "time_signature"),
+    "segments": interval_columns + ("loudness_start", "loudness_max", "loudness_max_time"),
+}
+
+
+class AudioAnalysis:
+    """
+    the audio analysis of a track as numpy arrays
+
+        .pitches / .timbre            segments x 12 float32 matrices
+        .segments["loudness_max"]     one float64 column per field in analysis_columns, same for
+        .beats / .bars / .tatums / .sections
+        .track                        the numeric fields of the "track" object (tempo, key, ...)
+
+    the response is parsed as it downloads so the big nested dict never exists, with cache_dir the arrays are
+    kept on disk compressed and read from there next time
+    """
+
+    def __init__(self, id: str, arrays: dict, track: dict):
+        self.id = id
+        self.track = track
+        self.pitches = arrays["segments.pitches"].reshape(-1, 12)
+        self.timbre = arrays["segments.timbre"].reshape(-1, 12)
+        for name, columns in analysis_columns.items():
+            setattr(self, name, {column: arrays[f"{name}.{column}"] for column in columns})
+
+    @classmethod
+    def fetch(cls, track, api=None, cache_dir: str = None) -> "AudioAnalysis":
+        """ track can be a Track or an id """
+        id = track if isinstance(track, str) else track.id
+        path = os.path.join(cache_dir, id + ".npz") if cache_dir is not None else None
+        if path is not None and os.path.exists(path):
+            return cls.load(path)
+
+        api = api if api is not None else gs.get_current_api()
+        stream = api.stream_track_audio_analysis(id)
+        try:
+            analysis = cls.parse(id, stream)
+        finally:
+            stream.close()
+
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            analysis.save(path)
+        return analysis
+
+    @classmethod
+    def parse(cls, id: str, stream) -> "AudioAnalysis":
+        """
+        builds the arrays straight from the parser events of a file object holding the JSON. a field that's missing
+        or null in an item is NaN in its column, as is the whole row of a pitches/timbre vector that isn't 12 long,
+        so the columns of a list always line up
+        """
+        buffers = {f"{name}.{column}": array("d") for name, columns in analysis_columns.items() for column in columns}
+        buffers["segments.pitches"] = array("f")
+        buffers["segments.timbre"] = array("f")
+        item_prefixes = {f"{name}.item": name for name in analysis_columns}
+        track = {}
+        # the values of the item being parsed, only written to the buffers once the item is complete
+        item = None
+        vectors = None
+
+        for prefix, event, value in ijson.parse(stream, use_float=True):
+            # only numbers are kept, that also skips the huge codestring/echoprintstring fields of "track"
+            if event == "number":
+                # "segments.item.pitches.item" -> "segments.pitches", "beats.item.start" -> "beats.start"
+                key = prefix.replace(".item", "")
+                if key in buffers:
+                    if vectors is not None and key in vectors:
+                        vectors[key].append(value)
+                    elif item is not None:
+                        item[key] = value
+                elif prefix.startswith("track.") and prefix.count(".") == 1:
+                    track[prefix[6:]] = value
+            elif event == "start_map" and prefix in item_prefixes:
+                item = {}
+                if prefix == "segments.item":
+                    vectors = {"segments.pitches": [], "segments.timbre": []}
+            elif event == "end_map" and prefix in item_prefixes:
+                name = item_prefixes[prefix]
+                for column in analysis_columns[name]:
+                    key = f"{name}.{column}"
+                    buffers[key].append(item.get(key, np.nan))
+                if vectors is not None:
+                    for key, vector in vectors.items():
+                        buffers[key].extend(vector if len(vector) == 12 else [np.nan] * 12)
+                item = vectors = None
+
+        arrays = {key: np.frombuffer(buffer, dtype=np.float32 if buffer.typecode == "f" else np.float64)
+                  for key, buffer in buffers.items()}
+        return cls(id, arrays, track)
+
+    def _arrays(self) -> dict:
+        arrays = {"segments.pitches": self.pitches.ravel(), "segments.timbre": self.timbre.ravel()}
+        for name in analysis_columns:
+            for column, values in getattr(self, name).items():
+                arrays[f"{name}.{column}"] = values
+        return arrays
+
+    def save(self, path: str):
+        """ compressed .npz, the track fields are stored as two arrays of keys and values """
+        np.savez_compressed(path, id=np.array(self.id), track_keys=np.array(list(self.track), dtype="U"),
+                            track_values=np.array(list(self.track.values()), dtype=np.float64), **self._arrays())
+
+    @classmethod
+    def load(cls, path: str) -> "AudioAnalysis":
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files if "." in key}
+            track = dict(zip(data["track_keys"].tolist(), data["track_values"].tolist()))
+            return cls(str(data["id"]), arrays, track)
+
+    def __repr__(self):
+        return f"AudioAnalysis('{self.id}') # {len(self.pitches)} segments, {len(self.beats['start'])} beats"
@@ -0,0 +1,133 @@
+import numpy as np
+from simpleSpotifyCore.api import attributes
+from . import globalstate as gs
+
+# the numeric fields of an audio features object, popularity comes from the track so it isn't one of them
+feature_columns = tuple(attribute for attribute in attributes if attribute != "popularity")
+
+
+def _track_id(track) -> str:
+    return track if isinstance(track, str) else track.id
+
+
+class AudioFeatureMatrix:
+    """
+    audio features for a lot of tracks packed into one float32 array, one row per track and one column per
+    feature (see feature_columns). rows are looked up by track id with .index
+
+        matrix = AudioFeatureMatrix.fetch(list_of_tracks_or_ids)
+        upbeat = matrix.filter(min_energy=0.8, min_tempo=120)
+        matrix.save("features")  then  AudioFeatureMatrix.load("features", mmap=True)
+    """
+
+    def __init__(self, ids, values: np.ndarray, columns: tuple = feature_columns):
+        self.ids = np.asarray(ids, dtype="U22")
+        self.values = np.ascontiguousarray(values, dtype=np.float32)
+        self.columns = tuple(columns)
+        self._column_index = {column: i for i, column in enumerate(self.columns)}
+        self.index = {id: row for row, id in enumerate(self.ids.tolist())}
+
+    @classmethod
+    def fetch(cls, tracks: list, api=None, chunk_size: int = 10000):
+        """
+        fetches the features of tracks (Track objects or ids) chunk_size at a time, the api splits every chunk
+        into 100 id requests and sends them in parallel. tracks spotify has no features for are left out
+        """
+        api = api if api is not None else gs.get_current_api()
+        ids = list(dict.fromkeys(_track_id(track) for track in tracks))
+
+        values = np.empty((len(ids), len(feature_columns)), dtype=np.float32)
+        found = []
+        for start in range(0, len(ids), chunk_size):
+            for features in api.multiple_track_audio_features(ids[start:start + chunk_size])["audio_features"]:
+                if features is None:
+                    continue
+                values[len(found)] = [features[column] for column in feature_columns]
+                found.append(features["id"])
+        return cls(found, values[:len(found)])
+
+    # -- lookups --
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, track) -> bool:
+        return _track_id(track) in self.index
+
+    def __getitem__(self, track) -> np.ndarray:
+        """ the feature row of a track or id """
+        return self.values[self.index[_track_id(track)]]
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[:, self._column_index[name]]
+
+    def rows(self, tracks: list) -> np.ndarray:
+        return self.values[[self.index[_track_id(track)] for track in tracks]]
+
+    def subset(self, mask) -> "AudioFeatureMatrix":
+        return AudioFeatureMatrix(self.ids[mask], self.values[mask], self.columns)
+
+    # -- vectorized operations --
+    def mask(self, **kwargs) -> np.ndarray:
+        """
+        boolean mask of the rows matching min_<feature>= / max_<feature>= (inclusive), the same keywords
+        get_seeded_recommendations takes. target_ keywords are accepted and ignored
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for kwarg, value in kwargs.items():
+            bound, _, column = kwarg.partition("_")
+            if bound not in ("min", "max", "target") or column not in self._column_index:
+                raise TypeError(f"Unexpected Keyword Argument {kwarg}")
+            if bound == "min":
+                mask &= self.column(column) >= value
+            elif bound == "max":
+                mask &= self.column(column) <= value
+        return mask
+
+    def filter(self, **kwargs) -> "AudioFeatureMatrix":
+        return self.subset(self.mask(**kwargs))
+
+    def normalized(self, method: str = "minmax") -> "AudioFeatureMatrix":
+        """ every column scaled to 0-1 ("minmax") or to mean 0 and std 1 ("zscore") """
+        if method == "minmax":
+            low, high = self.values.min(axis=0), self.values.max(axis=0)
+            scale = np.where(high > low, high - low, 1)
+            values = (self.values - low) / scale
+        elif method == "zscore":
+            std = self.values.std(axis=0)
+            values = (self.values - self.values.mean(axis=0)) / np.where(std > 0, std, 1)
+        else:
+            raise ValueError(f'method must be "minmax" or "zscore" not "{method}"')
+        return AudioFeatureMatrix(self.ids, values, self.columns)
+
+    def stats(self) -> dict:
+        """ {feature: {"mean", "std", "min", "max"}} """
+        mean, std = self.values.mean(axis=0), self.values.std(axis=0)
+        low, high = self.values.min(axis=0), self.values.max(axis=0)
+        return {column: {"mean": float(mean[i]), "std": float(std[i]), "min": float(low[i]), "max": float(high[i])}
+                for i, column in enumerate(self.columns)}
+
+    def concatenate(self, other: "AudioFeatureMatrix") -> "AudioFeatureMatrix":
+        """ this matrix with the rows of other it doesn't have yet added on """
+        if other.columns != self.columns:
+            raise ValueError("can't concatenate matrices with different columns")
+        new = np.array([id not in self.index for id in other.ids.tolist()], dtype=bool)
+        return AudioFeatureMatrix(np.concatenate([self.ids, other.ids[new]]),
+                                  np.concatenate([self.values, other.values[new]]), self.columns)
+
+    # -- files --
+    def save(self, path: str):
+        """ writes path.npy (the values) and path.ids.npy """
+        np.save(path + ".npy", self.values)
+        np.save(path + ".ids.npy", self.ids)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False) -> "AudioFeatureMatrix":
+        """ mmap=True memory maps the values instead of reading them into memory """
+        values = np.load(path + ".npy", mmap_mode="r" if mmap else None)
+        matrix = cls.__new__(cls)
+        matrix.ids = np.load(path + ".ids.npy")
+        matrix.values = values
+        matrix.columns = feature_columns
+        matrix._column_index = {column: i for i, column in enumerate(feature_columns)}
+        matrix.index = {id: row for row, id in enumerate(matrix.ids.tolist())}
+        return matrix
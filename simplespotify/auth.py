@@ -1,5 +1,6 @@
 import simpleSpotifyCore.tokenbearers as sstb
-from simpleSpotifyCore.api import SimpleSpotifyApi
+from simpleSpotifyCore.api import SimpleSpotifyApi, default_base_url
+from simpleSpotifyCore.asyncapi import AsyncSimpleSpotifyApi
 from . import globalstate as gs
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import urllib.parse
@@ -45,7 +46,8 @@ def host_Local_Server(server,authpage) :
 
 class Oauth2(sstb.Oauth2) :
 
-    def __init__(self,client_id,client_secret, request_session=None,redirecturl="http://localhost:8080",scopes = None, show_dialog = False,state= None):
+    def __init__(self,client_id,client_secret, request_session=None,redirecturl="http://localhost:8080",scopes = None, show_dialog = False,state= None,
+                 token_store=None, base_url=default_base_url, accounts_url=sstb.default_accounts_url):
         sstb.Oauth2.__init__(self,
                              client_id       = client_id,
                              client_secret   = client_secret,
@@ -53,9 +55,12 @@ class Oauth2(sstb.Oauth2) :
                              redirecturl     = redirecturl,
                              scopes          = scopes,
                              show_dialog     = show_dialog,
-                             state           = state
+                             state           = state,
+                             token_store     = token_store,
+                             accounts_url    = accounts_url
                              )
-        self.api = SimpleSpotifyApi(self, session = self._session)
+        self.base_url = base_url
+        self.api = SimpleSpotifyApi(self, session = self._session, base_url = base_url)
 
         if gs.current_bearer is None:
             self.use_globally()
@@ -69,10 +74,22 @@ class Oauth2(sstb.Oauth2) :
         gs.use_globally(self)
         return self
 
+    def use_locally(self):
+        """ with client.use_locally(): ... uses this bearer for the current thread / task only """
+        return gs.use_locally(self)
+
+    @property
+    def async_api(self):
+        # created lazily so aiohttp is only required when the async backend is actually used
+        if getattr(self, "_async_api", None) is None:
+            self._async_api = AsyncSimpleSpotifyApi(self, base_url=self.base_url)
+        return self._async_api
+
 
 class Client(sstb.Client) :
 
-    def __init__(self, client_id=None, client_secret=None, requests_session=None, scope=None, redirecturl="http://localhost:8080"):
+    def __init__(self, client_id=None, client_secret=None, requests_session=None, scope=None, redirecturl="http://localhost:8080",
+                 token_store=None, base_url=default_base_url, accounts_url=sstb.default_accounts_url):
 
         # SPOTIPY environment variables used for compatability
         if not client_id:
@@ -85,18 +102,30 @@ class Client(sstb.Client) :
             raise InsufficientCredentials('Insufficient Client Credentials')
 
         sstb.Client.__init__(self,client_id=client_id,client_secret = client_secret,requests_session=requests_session,scope=scope,
-                             redirecturl=redirecturl)
-        self.api = SimpleSpotifyApi(self, session = self.session)
+                             redirecturl=redirecturl, token_store=token_store, accounts_url=accounts_url)
+        self.base_url = base_url
+        self.api = SimpleSpotifyApi(self, session = self.session, base_url = base_url)
 
         if gs.current_bearer is None:
             self.use_globally()
 
     def create_oauth2(self,scopes = None,redirecturl=None, show_dialog= False) -> Oauth2 :
         o = Oauth2(client_id = self.client_id, client_secret = self.client_secret, redirecturl = redirecturl or self.redirecturl,
-                      request_session = self.session,scopes = scopes or self.scopes,show_dialog = show_dialog)
+                      request_session = self.session,scopes = scopes or self.scopes,show_dialog = show_dialog,
+                      token_store = self.token_store, base_url = self.base_url, accounts_url = self.accounts_url)
         o.api = self.api
         return o
     def use_globally(self):
         gs.use_globally(self)
         return self
-    # TODO: implement global shared session  with the session property
+
+    def use_locally(self):
+        """ with client.use_locally(): ... uses this bearer for the current thread / task only """
+        return gs.use_locally(self)
+
+    @property
+    def async_api(self):
+        # created lazily so aiohttp is only required when the async backend is actually used
+        if getattr(self, "_async_api", None) is None:
+            self._async_api = AsyncSimpleSpotifyApi(self, base_url=self.base_url)
+        return self._async_api
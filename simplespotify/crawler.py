@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import *
+from simpleSpotifyCore.IDtools import get_id
+from . import globalstate as gs
+from .sinks import Sink
+
+
+class RelatedArtistsCrawler:
+    """
+    breadth first walk of the related artists graph, fetching `concurrency` artists at a time
+
+        with CSVSink("edges.csv", append=True) as sink:
+            RelatedArtistsCrawler(["7mmU5GuOoyxoBAgOZkSVj7"], sink, depth=3, checkpoint="crawl.sqlite").run()
+
+    every edge goes to the sink as {"source", "target", "depth"} (depth of the target) as soon as it's found.
+        depth            - how many hops from the seeds to expand, None for no limit
+        limit            - stop after expanding this many artists, None for no limit
+        checkpoint       - sqlite file the visited set and the frontier are kept in. run() again with the same file
+                           after a crash (or after hitting limit) and it picks up where it stopped
+        checkpoint_every - artists expanded between saves of the frontier
+    the visited set lives in the checkpoint file, not in memory, so memory only grows with the frontier. artists
+    expanded after the last checkpoint are expanded again on resume so their edges can show up twice in the sink.
+    no Artist objects are built, the crawl doesn't fill Artist.cache
+    """
+
+    def __init__(self, seeds: list, sink: Sink, depth: Optional[int] = 2, limit: Optional[int] = None,
+                 concurrency: int = 8, checkpoint: Optional[str] = None, checkpoint_every: int = 500):
+        self.seeds = [seed.id if hasattr(seed, "id") else get_id(seed) for seed in seeds]
+        self.sink = sink
+        self.depth = depth
+        self.limit = limit
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self._temporary = checkpoint is None
+        if checkpoint is None:
+            fd, checkpoint = tempfile.mkstemp(suffix=".sqlite")
+            os.close(fd)
+        self.checkpoint = checkpoint
+        self.expanded = 0
+        self._conn = sqlite3.connect(checkpoint)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS visited (id TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS frontier (id TEXT PRIMARY KEY, depth INTEGER);
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER);
+        """)
+
+    @property
+    def _api(self):
+        return gs.get_current_api()
+
+    def _visit(self, id: str) -> bool:
+        """ marks id as visited, False if it already was """
+        return self._conn.execute("INSERT OR IGNORE INTO visited VALUES (?)", (id,)).rowcount == 1
+
+    def _load(self) -> deque:
+        row = self._conn.execute("SELECT value FROM state WHERE key = 'expanded'").fetchone()
+        if row is not None:
+            # resuming
+            self.expanded = row[0]
+            return deque(self._conn.execute("SELECT id, depth FROM frontier ORDER BY depth"))
+        frontier = deque((id, 0) for id in dict.fromkeys(self.seeds) if self._visit(id))
+        self._save(frontier, [])
+        return frontier
+
+    def _save(self, frontier: deque, in_flight: list):
+        """ one transaction, what's in flight goes back in the frontier since its edges may not be out yet """
+        self.sink.flush()
+        with self._conn:
+            self._conn.execute("DELETE FROM frontier")
+            self._conn.executemany("INSERT OR REPLACE INTO frontier VALUES (?, ?)", list(in_flight) + list(frontier))
+            self._conn.execute("INSERT OR REPLACE INTO state VALUES ('expanded', ?)", (self.expanded,))
+
+    def _related(self, id: str, api) -> list:
+        return [artist['id'] for artist in api.artist_related_artists(id)['artists']]
+
+    def _expand(self, id: str, depth: int, related: list, frontier: deque):
+        self.sink.write([{"source": id, "target": target, "depth": depth + 1} for target in related])
+        new = [target for target in related if self._visit(target)]
+        if self.depth is None or depth + 1 < self.depth:
+            frontier.extend((target, depth + 1) for target in new)
+
+    def run(self) -> int:
+        """ crawls until the frontier is empty or limit is reached, returns how many artists have been expanded """
+        frontier = self._load()
+        # looked up here, the pool's threads don't see a bearer set with use_locally
+        api = self._api
+        running = {}  # future -> (id, depth)
+        since_checkpoint = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="simplespotify-crawl") as pool:
+            try:
+                while frontier or running:
+                    while frontier and len(running) < self.concurrency and \
+                            (self.limit is None or self.expanded + len(running) < self.limit):
+                        id, depth = frontier.popleft()
+                        running[pool.submit(self._related, id, api)] = (id, depth)
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        id, depth = running.pop(future)
+                        try:
+                            related = future.result()
+                        except Exception:
+                            frontier.appendleft((id, depth))  # saved below so a rerun tries it again
+                            raise
+                        self._expand(id, depth, related, frontier)
+                        self.expanded += 1
+                        since_checkpoint += 1
+                    if since_checkpoint >= self.checkpoint_every:
+                        self._save(frontier, running.values())
+                        since_checkpoint = 0
+            finally:
+                for future in running:
+                    future.cancel()
+                self._save(frontier, running.values())
+        return self.expanded
+
+    def close(self):
+        self._conn.close()
+        if self._temporary:
+            os.unlink(self.checkpoint)
@@ -0,0 +1,166 @@
+import json
+import os
+from itertools import islice
+from typing import *
+from simpleSpotifyCore.IDtools import decode_id
+from . import globalstate as gs
+from .sinks import Sink, CSVSink, JSONLSink, ParquetSink
+
+
+# -- flattening --
+
+def _is_mapping(value) -> bool:
+    # dicts and the typed records fast_decode gives back
+    return isinstance(value, dict) or hasattr(value, "__struct_fields__")
+
+
+def _plain(value):
+    """ json.dumps default for records nested in lists """
+    return dict(value.items())
+
+
+def _cell(value):
+    if isinstance(value, list):
+        return json.dumps(value, default=_plain)
+    if _is_mapping(value):
+        return json.dumps(dict(value.items()), default=_plain)
+    return value
+
+
+def _flatten_into(flat: dict, record, prefix: str, sep: str):
+    for key, value in record.items():
+        if _is_mapping(value):
+            _flatten_into(flat, value, prefix + key + sep, sep)
+        else:
+            flat[prefix + key] = _cell(value)
+
+
+def _lookup(record, path: list):
+    for key in path:
+        if record is None:
+            return None
+        if isinstance(record, list):
+            index = int(key)
+            record = record[index] if -len(record) <= index < len(record) else None
+        else:
+            record = record.get(key)
+    return record
+
+
+def flatten(record, columns: Optional[Sequence[str]] = None, sep: str = ".") -> dict:
+    """
+    one flat row from a nested api dict. nested dicts become dotted columns ("album.name"), lists are written as
+    JSON. columns picks which ones (and their order), list items can be picked by index: "artists.0.name"
+    """
+    if columns is None:
+        flat = {}
+        _flatten_into(flat, record, "", sep)
+        return flat
+    return {column: _cell(_lookup(record, column.split(sep))) for column in columns}
+
+
+def _id_value(id, id_format: str):
+    try:
+        value = decode_id(id)
+    except (TypeError, ValueError):  # None, local tracks, user ids... stay as they are
+        return id
+    return value if id_format == "int" else value.to_bytes(16, "big")
+
+
+def _convert_ids(row: dict, id_format: str, sep: str) -> dict:
+    for column, value in row.items():
+        if column == "id" or column.endswith(sep + "id"):
+            row[column] = _id_value(value, id_format)
+    return row
+
+
+# -- sources --
+# raw dicts straight from the api, no Track/Album objects are built so nothing ends up in the object caches
+
+def _chunked(ids: Iterable, size: int) -> Iterator[list]:
+    ids = iter(ids)
+    while True:
+        chunk = list(islice(ids, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_multiple(method: str, key: str, ids: Iterable, chunk_size: int, **params) -> Iterator:
+    # the api splits every chunk into requests it accepts and sends them in parallel, only one chunk is held at once
+    api = gs.get_current_api()
+    for chunk in _chunked(ids, chunk_size):
+        for apidict in getattr(api, method)(chunk, **params)[key]:
+            if apidict is not None:
+                yield apidict
+
+
+def iter_tracks(ids: Iterable[str], market: Optional[str] = None, chunk_size: int = 1000) -> Iterator:
+    return _iter_multiple("multiple_tracks", "tracks", ids, chunk_size, market=market)
+
+
+def iter_albums(ids: Iterable[str], market: Optional[str] = None, chunk_size: int = 1000) -> Iterator:
+    return _iter_multiple("multiple_albums", "albums", ids, chunk_size, market=market)
+
+
+def iter_artists(ids: Iterable[str], chunk_size: int = 1000) -> Iterator:
+    return _iter_multiple("multiple_artists", "artists", ids, chunk_size)
+
+
+def iter_audio_features(ids: Iterable[str], chunk_size: int = 1000) -> Iterator:
+    return _iter_multiple("multiple_track_audio_features", "audio_features", ids, chunk_size)
+
+
+def iter_playlist_items(playlist_id: str, fields: Optional[str] = None, market: Optional[str] = None) -> Iterator:
+    """ the playlist's items ({"added_at", "added_by", "track", ...}), use columns like "track.name" """
+    return gs.get_current_api().iter_playlist_tracks(playlist_id, fields=fields, market=market)
+
+
+# -- export --
+
+def open_sink(path: str, columns: Optional[Sequence[str]] = None, row_group_size: int = 65536) -> Sink:
+    """ a sink for path picked by its extension, .jsonl .csv or .parquet """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        return JSONLSink(path)
+    if extension == ".csv":
+        return CSVSink(path, columns=columns)
+    if extension in (".parquet", ".pq"):
+        return ParquetSink(path, columns=columns, row_group_size=row_group_size)
+    raise ValueError(f"no sink for {extension} files, pass a Sink instead")
+
+
+def export(records: Iterable, sink: Union[Sink, str], columns: Optional[Sequence[str]] = None,
+           batch_size: int = 1000, sep: str = ".", id_format: str = "b62") -> int:
+    """
+    streams records (any of the iter_* sources above or the api's iter_* methods) to sink flattened, batch_size
+    rows at a time, memory stays flat however many rows go out. sink can be a Sink or a path (see open_sink),
+    a path is closed when done, a Sink is left open. pass columns for csv/parquet when records can leave fields
+    out, otherwise the columns of the first row are used. id_format="int" writes the "id" columns ("id",
+    "album.id", ...) as the 128 bit number they stand for (see IDtools.SpotifyID), "bytes" as 16 big endian bytes
+    which is what parquet can hold. returns the number of rows written
+
+        export(iter_tracks(ids), "tracks.parquet", columns=["id", "name", "album.name", "artists.0.name"])
+    """
+    if id_format not in ("b62", "int", "bytes"):
+        raise ValueError(f'id_format must be "b62", "int" or "bytes" not "{id_format}"')
+    owned = isinstance(sink, str)
+    if owned:
+        sink = open_sink(sink, columns)
+    written = 0
+    try:
+        batch = []
+        for record in records:
+            row = flatten(record, columns, sep)
+            batch.append(row if id_format == "b62" else _convert_ids(row, id_format, sep))
+            if len(batch) >= batch_size:
+                sink.write(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            sink.write(batch)
+            written += len(batch)
+    finally:
+        if owned:
+            sink.close()
+    return written
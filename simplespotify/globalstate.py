@@ -1,17 +1,47 @@
+import contextvars
+from contextlib import contextmanager
 from simpleSpotifyCore.ssexceptions import *
 from simpleSpotifyCore.api import APIbase
 
 
+# used everywhere that doesn't have its own bearer set with use_locally
 current_bearer = None
 
+# the bearer for the current thread / asyncio task, falls back to current_bearer when unset.
+# new threads start without one, run them with contextvars.copy_context().run to carry it over
+_local_bearer = contextvars.ContextVar("simplespotify_bearer", default=None)
+
 
 def use_globally(bear) :
     global current_bearer
     current_bearer = bear
 
 
+@contextmanager
+def use_locally(bear):
+    """ with use_locally(client): ... makes client the bearer for this thread / task only """
+    token = _local_bearer.set(bear)
+    try:
+        yield bear
+    finally:
+        _local_bearer.reset(token)
+
+
+def get_current_bearer():
+    bear = _local_bearer.get()
+    return bear if bear is not None else current_bearer
+
+
 def get_current_api(*_args) -> APIbase :
-    if current_bearer is None :
+    bear = get_current_bearer()
+    if bear is None :
         raise InsufficientCredentials("No Global API currently used")
-    return current_bearer.api
+    return bear.api
+
 
+
+def get_current_async_api(*_args):
+    bear = get_current_bearer()
+    if bear is None :
+        raise InsufficientCredentials("No Global API currently used")
+    return bear.async_api
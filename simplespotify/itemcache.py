@@ -0,0 +1,287 @@
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from simpleSpotifyCore.instrumentation import default_instrumentation
+from simpleSpotifyCore.IDtools import decode_id, format_id
+
+
+def _approx_size(obj) -> int:
+    """ rough byte count of an api dict, good enough for a cache budget """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict) or hasattr(obj, "__struct_fields__"):  # dicts and fast_decode records
+        for key, value in obj.items():
+            size += sys.getsizeof(key) + _approx_size(value)
+    elif isinstance(obj, list):
+        for value in obj:
+            size += _approx_size(value)
+    return size
+
+
+class _SecondaryIndex(MutableMapping):
+    """ names/searches index, remembers which keys point at which id so evictions can clean up after themselves """
+
+    def __init__(self, owner, weak: bool, index: str):
+        self._owner = owner
+        self._index = index
+        self._data = weakref.WeakValueDictionary() if weak else {}
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, item):
+        with self._owner._lock:
+            self._data[key] = item
+            if not isinstance(self._data, weakref.WeakValueDictionary):
+                self._owner._secondary_keys.setdefault(self._owner._key(item.id), []).append((self, key))
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __contains__(self, key):
+        found = key in self._data
+        self._owner._count("hits" if found else "misses", self._index)
+        return found
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _IdIndex(MutableMapping):
+    """ the ids index, this is where the size limits and eviction happen """
+
+    def __init__(self, owner):
+        self._owner = owner
+        self._entries = OrderedDict()  # id -> [item, size, stored_at], oldest / least recently used first
+        self._weak = weakref.WeakValueDictionary() if owner.weak else None
+
+    def _expired(self, entry) -> bool:
+        ttl = self._owner.ttl
+        return ttl is not None and time.monotonic() - entry[2] > ttl
+
+    def _lookup(self, id):
+        entry = self._entries.get(id)
+        if entry is not None:
+            if self._expired(entry):
+                self._owner._evict(id)
+                return None
+            if self._owner.policy == "lru":
+                self._entries.move_to_end(id)
+            return entry[0]
+        if self._weak is not None:
+            # evicted from the strong part but something else still holds it, put it back
+            item = self._weak.get(id)
+            if item is not None:
+                self._store(id, item)
+            return item
+        return None
+
+    def _store(self, id, item):
+        size = _approx_size(item._apidict) if self._owner.max_bytes is not None else 0
+        old = self._entries.pop(id, None)
+        if old is not None:
+            self._owner.bytes -= old[1]
+        self._entries[id] = [item, size, time.monotonic()]
+        self._owner.bytes += size
+        if self._weak is not None:
+            self._weak[id] = item
+        self._owner._enforce()
+
+    def __getitem__(self, id):
+        with self._owner._lock:
+            item = self._lookup(self._owner._key(id))
+        if item is None:
+            raise KeyError(id)
+        return item
+
+    def get(self, id, default=None):
+        with self._owner._lock:
+            item = self._lookup(self._owner._key(id))
+        self._owner._count("hits" if item is not None else "misses", "ids")
+        return item if item is not None else default
+
+    def peek(self, id, default=None):
+        """ get() without counting a hit or miss, for lookups that have been counted already """
+        with self._owner._lock:
+            item = self._lookup(self._owner._key(id))
+        return item if item is not None else default
+
+    def __contains__(self, id):
+        with self._owner._lock:
+            found = self._lookup(self._owner._key(id)) is not None
+        self._owner._count("hits" if found else "misses", "ids")
+        return found
+
+    def __setitem__(self, id, item):
+        with self._owner._lock:
+            self._store(self._owner._key(id), item)
+
+    def setdefault(self, id, item):
+        """ atomic, the item already cached for id if there is one, otherwise item after caching it """
+        key = self._owner._key(id)
+        with self._owner._lock:
+            existing = self._lookup(key)
+            if existing is not None:
+                return existing
+            self._store(key, item)
+            return item
+
+    def __delitem__(self, id):
+        key = self._owner._key(id)
+        with self._owner._lock:
+            if key not in self._entries and (self._weak is None or key not in self._weak):
+                raise KeyError(id)
+            self._owner._evict(key, count=False)
+
+    def __iter__(self):
+        keys = list(self._weak if self._weak is not None else self._entries)
+        if self._owner.int_keys:
+            keys = [format_id(key) if isinstance(key, int) else key for key in keys]
+        return iter(keys)
+
+    def __len__(self):
+        return len(self._weak if self._weak is not None else self._entries)
+
+
+class ItemCache:
+    """
+    object cache for one SpotifyItem class, used exactly like the old {'ids': {}, 'names': {}, 'searches': {}}
+
+    by default it keeps everything like before. configure() limits it:
+        max_entries - most objects kept
+        max_bytes   - rough budget for the api dicts of the kept objects
+        policy      - "lru" drops the least recently used first, "ttl" drops the oldest first
+        ttl         - seconds an object stays cached (either policy)
+        weak        - objects still referenced elsewhere stay findable after being evicted
+        int_keys    - key the ids index on the 128 bit number of each id (see IDtools.SpotifyID) instead of the
+                      string, ids are decoded on every lookup so it trades a little cpu for smaller keys
+    evicting an object also removes its names/searches entries. hits and misses are also reported to the default
+    instrumentation (simpleSpotifyCore.instrumentation) as "<class>.ids", "<class>.names" and "<class>.searches"
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, policy: str = "lru", ttl: float = None,
+                 weak: bool = False, int_keys: bool = False):
+        self._lock = threading.RLock()
+        self.name = "ItemCache"
+        self._owner_cls = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._secondary_keys = {}  # id -> [(index, key)]
+        self.max_entries = None
+        self.max_bytes = None
+        self.policy = "lru"
+        self.ttl = None
+        self.weak = weak
+        self.int_keys = int_keys
+        self._build_indexes()
+        self.configure(max_entries=max_entries, max_bytes=max_bytes, policy=policy, ttl=ttl)
+
+    def _build_indexes(self):
+        self.ids = _IdIndex(self)
+        self.names = _SecondaryIndex(self, self.weak, "names")
+        self.searches = _SecondaryIndex(self, self.weak, "searches")
+
+    def configure(self, max_entries: int = None, max_bytes: int = None, policy: str = "lru", ttl: float = None,
+                  weak: bool = None, int_keys: bool = None):
+        """
+        changes the limits, anything over the new ones is evicted straight away. changing weak or int_keys clears
+        the cache
+        """
+        if policy not in ("lru", "ttl"):
+            raise ValueError(f'policy must be "lru" or "ttl" not "{policy}"')
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self.policy = policy
+            self.ttl = ttl
+            if (weak is not None and weak != self.weak) or (int_keys is not None and int_keys != self.int_keys):
+                self.weak = weak if weak is not None else self.weak
+                self.int_keys = int_keys if int_keys is not None else self.int_keys
+                self.clear()
+            else:
+                self._enforce()
+        return self
+
+    def __getitem__(self, index: str):
+        if index not in ("ids", "names", "searches"):
+            raise KeyError(index)
+        return getattr(self, index)
+
+    def __set_name__(self, owner, attr):
+        # cache = ItemCache() in a class body, hits and misses are reported as "Track.ids", "Track.names"...
+        self.name = owner.__name__
+        self._owner_cls = owner
+
+    def _key(self, id):
+        """ what the ids index keys id on, ids that aren't spotify ids stay strings either way """
+        if self.int_keys:
+            if isinstance(id, str):
+                try:
+                    return decode_id(id)
+                except ValueError:
+                    return id
+            return id
+        return format_id(id) if isinstance(id, int) else id
+
+    def _count(self, stat: str, index: str):
+        with self._lock:
+            setattr(self, stat, getattr(self, stat) + 1)
+        instrumentation = default_instrumentation()
+        if instrumentation.enabled:
+            instrumentation.on_cache(f"{self.name}.{index}", stat == "hits")
+
+    def _evict(self, id, count: bool = True):
+        entry = self.ids._entries.pop(id, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+        if count:
+            self.evictions += 1
+        if self.weak and count:
+            # weak mode only drops the strong reference, the indexes clean themselves up when it's collected
+            return
+        if self.ids._weak is not None:
+            self.ids._weak.pop(id, None)
+        if entry is not None:
+            self._discard_pending(entry[0].id)
+        for index, key in self._secondary_keys.pop(id, ()):
+            item = index._data.get(key)
+            if item is not None and self._key(item.id) == id:
+                del index._data[key]
+
+    def _discard_pending(self, id: str):
+        # an evicted item shouldn't be picked up by the class's HydrationLoader for the next batch either
+        loader = self._owner_cls.__dict__.get("_loader") if self._owner_cls is not None else None
+        if loader is not None:
+            loader.discard(id)
+
+    def _enforce(self):
+        entries = self.ids._entries
+        if self.ttl is not None:
+            # only looks at the front, anything expired further back is dropped when it's next looked up
+            now = time.monotonic()
+            while entries and now - next(iter(entries.values()))[2] > self.ttl:
+                self._evict(next(iter(entries)))
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries) or
+                           (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            self._evict(next(iter(entries)))
+        if self.weak and self.max_entries is None and self.max_bytes is None:
+            # unbounded weak cache holds no strong references at all
+            entries.clear()
+            self.bytes = 0
+
+    def clear(self):
+        with self._lock:
+            self.bytes = 0
+            self._secondary_keys = {}
+            self._build_indexes()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.ids), "bytes": self.bytes}
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import weakref
+from simpleSpotifyCore.api import multiple_limits
+
+
+class HydrationLoader:
+    """
+    batches lookups for one SpotifyItem class into multiple_* calls (DataLoader style)
+
+    simplified items register themselves here when they're built, the first time any of them needs its full
+    attributes the whole batch gets fetched in one call instead of one single_* call per item. id lookups
+    that miss the cache ride along in the same calls. pending items are only weakly referenced so they don't
+    outlive the cache's limits
+    """
+
+    def __init__(self, itemcls, max_pending: int = 5000, window: float = 0):
+        self.itemcls = itemcls
+        self.method, self.key = itemcls._multiple_endpoint
+        self.batch_size = multiple_limits[self.key]
+        self.max_pending = max_pending
+        self.window = window  # seconds the async loader waits to collect lookups, 0 is "same loop tick"
+
+        self._pending = weakref.WeakValueDictionary()  # id -> simplified item waiting to be hydrated, oldest first
+        self._lock = threading.Lock()
+
+        self._waiting = {}  # id -> future, async lookups collected for the next flush
+        self._flush_handle = None
+        self._flushes = set()  # running _flush_async tasks, the loop only keeps weak references to them
+
+    # -- bookkeeping --
+    def defer(self, item):
+        """ remember a simplified item so it can piggyback on the next batch """
+        with self._lock:
+            self._pending[item.id] = item
+            if len(self._pending) > self.max_pending:
+                del self._pending[next(iter(self._pending))]
+
+    def discard(self, id: str):
+        with self._lock:
+            self._pending.pop(id, None)
+
+    def _take_pending(self, count: int, exclude, order: list = None) -> list:
+        """ pops up to count pending items that aren't in exclude, in order if given (oldest first otherwise) """
+        taken = []
+        with self._lock:
+            for id in (order if order is not None else list(self._pending)):
+                if len(taken) >= count:
+                    break
+                if id in exclude or id not in self._pending:
+                    continue
+                item = self._pending.pop(id, None)
+                if item is not None and item._form != "full":
+                    taken.append(item)
+        return taken
+
+    def _fill(self, ids: list) -> list:
+        """ pending items that fit in the spare room of the last batch for ids """
+        return self._take_pending(-len(ids) % self.batch_size, set(ids))
+
+    def _apply(self, ids: list, items: list, dicts: list) -> list:
+        """ hydrates items with their dicts and turns the dicts for ids into objects """
+        for item, apidict in zip(items, dicts[len(ids):]):
+            if apidict is not None:
+                item._hydrate(apidict)
+        # the lookups for ids were counted as misses by whoever called fetch
+        return [self.itemcls._from_dict(apidict, count=False) for apidict in dicts[:len(ids)]]
+
+    # -- sync --
+    def fetch(self, ids: list) -> list:
+        """ objects for ids (None if unknown), pending items are hydrated in the same calls """
+        with self._lock:
+            for id in ids:
+                self._pending.pop(id, None)
+        items = self._fill(ids)
+        dicts = getattr(self.itemcls._api.fget(), self.method)(ids + [item.id for item in items])[self.key]
+        return self._apply(ids, items, dicts)
+
+    def load(self, item):
+        """ hydrates item along with a batch worth of pending items """
+        self.hydrate([item])
+
+    def hydrate(self, items: list):
+        """ hydrates every simplified (or projected) item in items, topping the last batch up with pending ones """
+        items = [item for item in dict.fromkeys(items) if item._form != "full"]
+        if len(items) == 0:
+            return
+        with self._lock:
+            # items built right after this one (the rest of an album's tracks...) are the likeliest to be read next
+            order = list(self._pending)
+            start = order.index(items[0].id) if items[0].id in self._pending else 0
+            for item in items:
+                self._pending.pop(item.id, None)
+        items = items + self._take_pending(-len(items) % self.batch_size, {item.id for item in items},
+                                           order[start:] + order[:start])
+        self._apply([], items, getattr(self.itemcls._api.fget(), self.method)([item.id for item in items])[self.key])
+
+    # -- async --
+    async def fetch_async(self, id: str):
+        """ collects every lookup made in the same tick (or window) and sends them as one multiple_* call """
+        loop = asyncio.get_running_loop()
+        future = self._waiting.get(id)
+        if future is None:
+            future = self._waiting[id] = loop.create_future()
+            if self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window, self._start_flush, loop)
+        return await future
+
+    def _start_flush(self, loop):
+        task = loop.create_task(self._flush_async())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush_async(self):
+        waiting, self._waiting, self._flush_handle = self._waiting, {}, None
+        ids = list(waiting)
+        items = self._fill(ids)
+        try:
+            dicts = (await getattr(self.itemcls._async_api.fget(), self.method)(ids + [item.id for item in items]))[self.key]
+        except Exception as e:
+            for future in waiting.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, obj in zip(waiting.values(), self._apply(ids, items, dicts)):
+            if not future.done():
+                future.set_result(obj)
@@ -0,0 +1,190 @@
+import threading
+import numpy as np
+from .audiofeatures import AudioFeatureMatrix, feature_columns
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # only needed for mode="kdtree"
+    cKDTree = None
+
+# the features distances are measured on by default, the rest (key, mode, ...) are better as filters
+similarity_features = ("acousticness", "danceability", "energy", "instrumentalness", "liveness", "loudness",
+                       "speechiness", "tempo", "valence")
+
+
+class SimilarityIndex:
+    """
+    local nearest neighbour search over audio features, a get_seeded_recommendations you can run on your own
+    catalog and offline
+
+        index = SimilarityIndex(AudioFeatureMatrix.fetch(my_tracks), mode="kdtree")
+        index.query(seed_tracks=[track], limit=20, min_energy=0.5, target_tempo=128)
+
+    modes:
+        "brute"     - exact, every row compared with numpy
+        "kdtree"    - exact, scipy's cKDTree, fastest for big catalogs
+        "quantized" - every feature stored as a uint8 instead of a float32, a quarter of the memory. candidates
+                      are reranked exactly from the matrix
+    features are z-scored with the statistics of the first build so distances don't depend on units. add() puts
+    new tracks in without a rebuild, follow(Track) adds every track that gets hydrated from then on.
+    """
+
+    def __init__(self, matrix: AudioFeatureMatrix = None, mode: str = "brute", features: tuple = similarity_features,
+                 rebuild_ratio: float = 0.1):
+        if mode not in ("brute", "kdtree", "quantized"):
+            raise ValueError(f'mode must be "brute", "kdtree" or "quantized" not "{mode}"')
+        if mode == "kdtree" and cKDTree is None:
+            raise ImportError('mode="kdtree" requires scipy')
+        self.mode = mode
+        self.features = tuple(features)
+        self.rebuild_ratio = rebuild_ratio  # the kd-tree is rebuilt once this many rows have been added since
+        self.matrix = None
+        self._pending_ids = []  # tracks seen by follow() that still need their features fetched
+        self._lock = threading.RLock()
+        if matrix is not None:
+            self.add(matrix)
+
+    # -- building --
+    def _scaled(self, values: np.ndarray) -> np.ndarray:
+        return (values - self._mean) / self._std
+
+    def _build(self):
+        columns = [feature_columns.index(feature) for feature in self.features]
+        if not hasattr(self, "_mean"):
+            base = self.matrix.values[:, columns]
+            self._columns = columns
+            self._mean = base.mean(axis=0)
+            self._std = np.where(base.std(axis=0) > 0, base.std(axis=0), 1)
+        points = self._scaled(self.matrix.values[:, self._columns]).astype(np.float32)
+        self._tree = cKDTree(points) if self.mode == "kdtree" else None
+        self._tree_size = len(points)
+        if self.mode == "quantized":
+            # only the codes are kept, _scaled_rows recomputes the exact points for the rerank
+            self._low = points.min(axis=0)
+            self._step = np.where(points.max(axis=0) > self._low, (points.max(axis=0) - self._low) / 255, 1)
+            self._codes = self._quantize(points)
+            self._points = None
+        else:
+            self._points = points
+
+    def _quantize(self, points: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((points - self._low) / self._step), 0, 255).astype(np.uint8)
+
+    def _scaled_rows(self, rows: np.ndarray) -> np.ndarray:
+        if self._points is not None:
+            return self._points[rows]
+        return self._scaled(self.matrix.values[rows][:, self._columns]).astype(np.float32)
+
+    def add(self, matrix: AudioFeatureMatrix):
+        """ adds the rows of matrix that aren't in the index yet """
+        with self._lock:
+            if self.matrix is None:
+                self.matrix = matrix
+                self._build()
+                return
+            old = len(self.matrix)
+            self.matrix = self.matrix.concatenate(matrix)
+            new = self._scaled(self.matrix.values[old:, self._columns]).astype(np.float32)
+            if self.mode == "quantized":
+                self._codes = np.concatenate([self._codes, self._quantize(new)])
+                return
+            self._points = np.concatenate([self._points, new])
+            if self.mode == "kdtree" and len(self._points) - self._tree_size > self.rebuild_ratio * self._tree_size:
+                self._tree = cKDTree(self._points)
+                self._tree_size = len(self._points)
+
+    def follow(self, itemcls):
+        """ every track of itemcls (Track) hydrated from now on is added, their features are fetched on the next query """
+        itemcls.on_hydrate(lambda track: self._pending_ids.append(track.id))
+        return self
+
+    def _sync(self):
+        with self._lock:
+            ids, self._pending_ids = self._pending_ids, []
+            ids = [id for id in ids if self.matrix is None or id not in self.matrix]
+        if ids:
+            self.add(AudioFeatureMatrix.fetch(ids))
+
+    def __len__(self):
+        return 0 if self.matrix is None else len(self.matrix)
+
+    # -- querying --
+    def _seed_rows(self, seed_tracks, seed_artists) -> list:
+        tracks = list(seed_tracks or [])
+        for artist in seed_artists or []:
+            tracks.extend(artist.top_tracks())
+        ids = [track if isinstance(track, str) else track.id for track in tracks]
+        missing = [id for id in ids if id not in self.matrix]
+        if missing:
+            self.add(AudioFeatureMatrix.fetch(missing))
+        return [self.matrix.index[id] for id in ids if id in self.matrix]
+
+    def _candidates(self, query: np.ndarray, count: int) -> np.ndarray:
+        """ row numbers of roughly the count nearest rows """
+        count = min(count, len(self.matrix))
+        if self.mode == "kdtree":
+            _, rows = self._tree.query(query, k=count)
+            rows = np.atleast_1d(rows)
+            if self._tree_size < len(self._points):
+                # rows added since the last rebuild are searched by brute force
+                extra = np.arange(self._tree_size, len(self._points))
+                rows = np.concatenate([rows, extra])
+            return rows
+        if self.mode == "quantized":
+            codes = self._codes.astype(np.int32) - self._quantize(query[None, :]).astype(np.int32)
+            distances = np.einsum("ij,ij->i", codes, codes)
+        else:
+            diff = self._points - query
+            distances = np.einsum("ij,ij->i", diff, diff)
+        if count >= len(distances):
+            return np.arange(len(distances))
+        return np.argpartition(distances, count - 1)[:count]
+
+    def query(self, seed_tracks: list = None, seed_artists: list = None, limit: int = 20, **kwargs) -> list:
+        """
+        ids of the limit tracks closest to the average of the seeds (tracks or ids, and Artists whose top tracks are
+        used) that aren't seeds themselves. takes min_/max_/target_<feature> like get_seeded_recommendations:
+        min/max are hard limits, target replaces the seeds' value for that feature
+        """
+        self._sync()
+        with self._lock:
+            if self.matrix is None or len(self.matrix) == 0:
+                return []
+            seeds = self._seed_rows(seed_tracks, seed_artists)
+            mask = self.matrix.mask(**kwargs)  # checks the kwargs as well
+            if not seeds and not any(kwarg.startswith("target_") for kwarg in kwargs):
+                raise ValueError("need at least one seed or target_ keyword")
+
+            # the query in raw feature space so targets can be dropped in, distances are measured on every
+            # similarity feature plus any feature with a target
+            raw = self.matrix.values[seeds].mean(axis=0) if seeds else self.matrix.values.mean(axis=0)
+            targets = {kwarg[7:]: value for kwarg, value in kwargs.items() if kwarg.startswith("target_")}
+            for feature, value in targets.items():
+                raw[feature_columns.index(feature)] = value
+            query = self._scaled(raw[self._columns]).astype(np.float32)
+            extra = [feature_columns.index(feature) for feature in targets if feature not in self.features]
+
+            mask[seeds] = False
+            # quantized distances are approximate so it needs a lot more candidates for the rerank
+            count = limit * (32 if self.mode == "quantized" else 4)
+            while True:
+                rows = self._candidates(query, count)
+                rows = rows[mask[rows]]
+                if len(rows) >= limit * 2 or count >= len(self.matrix):
+                    break
+                count *= 4
+
+            # exact rerank of the candidates
+            diff = self._scaled_rows(rows) - query
+            distances = np.einsum("ij,ij->i", diff, diff)
+            if extra:
+                spread = self.matrix.values[:, extra].std(axis=0)
+                offsets = (self.matrix.values[rows][:, extra] - raw[extra]) / np.where(spread > 0, spread, 1)
+                distances += np.einsum("ij,ij->i", offsets, offsets)
+            best = rows[np.argsort(distances, kind="stable")[:limit]]
+            return self.matrix.ids[best].tolist()
+
+    def query_tracks(self, *args, **kwargs) -> list:
+        """ query() but returns Track objects """
+        from .UserClasses import Track
+        return Track.from_id(self.query(*args, **kwargs))
@@ -0,0 +1,124 @@
+import abc
+import csv
+import json
+import os
+from typing import *
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only needed for ParquetSink
+    pyarrow = None
+
+
+class Sink(abc.ABC):
+    """
+    somewhere rows get streamed to (the crawler's edges, exports...). write() takes a list of flat dicts, sinks
+    write them out as they come so nothing piles up in memory. use them as context managers or close() them
+    """
+
+    @abc.abstractmethod
+    def write(self, rows: list):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _FileSink(Sink):
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.appending = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JSONLSink(_FileSink):
+    """ one JSON object per line, append=True keeps what's in the file already (for resumed crawls) """
+
+    def write(self, rows: list):
+        self.file.write("".join(json.dumps(row) + "\n" for row in rows))
+
+
+class CSVSink(_FileSink):
+    """
+    csv with a header row, columns are taken from the first row if not given. keys that aren't in columns are
+    left out, missing ones are left empty. append=True only writes the header if the file was empty
+    """
+
+    def __init__(self, path: str, columns: Optional[Sequence[str]] = None, append: bool = False):
+        _FileSink.__init__(self, path, append)
+        self.columns = list(columns) if columns is not None else None
+        self._writer = None
+
+    def write(self, rows: list):
+        if not rows:
+            return
+        if self._writer is None:
+            if self.columns is None:
+                self.columns = list(rows[0])
+            self._writer = csv.DictWriter(self.file, fieldnames=self.columns, extrasaction="ignore")
+            if not self.appending:
+                self._writer.writeheader()
+        self._writer.writerows(rows)
+
+
+class ParquetSink(Sink):
+    """
+    parquet, rows are buffered and written as a row group every row_group_size rows so memory stays flat. the
+    schema comes from the first row group (or columns picks and orders them), pass a pyarrow schema if a column
+    can be empty all through the first group. parquet files can't be appended to, the file is only readable once
+    the sink is closed
+    """
+
+    def __init__(self, path: str, columns: Optional[Sequence[str]] = None, row_group_size: int = 65536,
+                 schema=None):
+        if pyarrow is None:
+            raise ImportError("ParquetSink requires pyarrow to be installed")
+        self.path = path
+        self.columns = list(columns) if columns is not None else None
+        self.row_group_size = row_group_size
+        self.schema = schema
+        if schema is not None and self.columns is None:
+            self.columns = list(schema.names)
+        self._buffer = []
+        self._writer = None
+
+    def write(self, rows: list):
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self.row_group_size:
+            self._write_group(self._buffer[:self.row_group_size])
+            del self._buffer[:self.row_group_size]
+
+    def _write_group(self, rows: list):
+        if self.columns is None:
+            self.columns = list(rows[0])
+        table = pyarrow.table({column: [row.get(column) for row in rows] for column in self.columns},
+                              schema=self.schema)
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        else:
+            table = table.cast(self._writer.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        # flush() does nothing, a parquet file is only readable once it's closed anyway
+        if self._buffer:
+            self._write_group(self._buffer)
+            self._buffer = []
+        if self._writer is not None:
+            self._writer.close()
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from typing import *
+from . import globalstate as gs
+
+
+def _track_fields(fields: Optional[str]) -> Optional[str]:
+    """ a fields filter for the playlist tracks endpoint from one relative to the track, keeps what paging needs """
+    if fields is None:
+        return None
+    return f"total,next,limit,items(track({fields},id,type))"
+
+
+def _build_track(item: dict, projected: bool = False):
+    """ the Track for one playlist item, None for episodes, local files and removed tracks """
+    from .UserClasses import Track
+    track = item.get('track')
+    if not track or not track.get('id') or track.get('type', 'track') != 'track':
+        return None
+    return Track._from_projection(track) if projected else Track._from_dict(track)
+
+
+class TrackCollection:
+    """
+    the tracks of a playlist, paged in from the api as they're needed
+
+        playlist.tracks[0]          - one page fetched
+        playlist.tracks[-10:]       - only the pages the slice touches, fetched in parallel
+        len(playlist.tracks)        - no fetch if the total is already known
+        for track in playlist.tracks - full scan, upcoming pages are prefetched while you go
+
+    Track objects are built when they're read, indexing gives None for items that aren't tracks (episodes, local
+    files, removed tracks) and iterating skips them. only max_pages pages are kept, iterating doesn't keep any,
+    so walking a 10,000 track playlist holds a few pages at a time (the Tracks themselves go in Track.cache, see
+    ItemCache.configure to bound that too). fields is a fields filter relative to the track like in
+    Playlist.track_page, the rest of each track is fetched the first time it's read
+    """
+
+    def __init__(self, playlist_id: str, first_page: Optional[dict] = None, fields: Optional[str] = None,
+                 market: Optional[str] = None, page_size: int = 100, max_pages: int = 32):
+        self.playlist_id = playlist_id
+        self.fields = fields
+        self.market = market
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._total = None
+        self._pages = OrderedDict()  # page number -> raw items, least recently used first
+        self._lock = threading.Lock()
+        if first_page is not None:
+            self._total = first_page.get('total')
+            # a full playlist comes with its first page of tracks, unless a fields filter changed it
+            if 'items' in first_page and fields is None and first_page.get('offset', 0) == 0 \
+                    and first_page.get('limit', page_size) == page_size:
+                self._store(0, first_page['items'])
+
+    @property
+    def _api(self):
+        return gs.get_current_api()
+
+    def _store(self, number: int, items: list):
+        with self._lock:
+            self._pages[number] = items
+            self._pages.move_to_end(number)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def _fetch_page(self, number: int, api=None) -> list:
+        # api is passed in from the calling thread when this runs on a worker, which doesn't see use_locally bearers
+        api = api if api is not None else self._api
+        page = api.playlist_tracks(self.playlist_id, fields=_track_fields(self.fields), limit=self.page_size,
+                                         offset=number * self.page_size, market=self.market)
+        if page.get('total') is not None:
+            self._total = page['total']
+        self._store(number, page['items'])
+        return page['items']
+
+    def _page(self, number: int) -> list:
+        with self._lock:
+            items = self._pages.get(number)
+            if items is not None:
+                self._pages.move_to_end(number)
+                return items
+        return self._fetch_page(number)
+
+    def _load_pages(self, numbers: list):
+        """ fetches every page in numbers that isn't kept yet, in parallel on the api's worker pool """
+        with self._lock:
+            missing = [number for number in numbers if number not in self._pages]
+        if missing:
+            api = self._api
+            api._map(lambda number: self._fetch_page(number, api), missing)
+
+    def _build(self, item: dict):
+        return _build_track(item, projected=self.fields is not None)
+
+    def __len__(self) -> int:
+        if self._total is None:
+            self._page(0)
+        return self._total
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(*index.indices(len(self)))
+            if len(indices) == 0:
+                return []
+            numbers = list(dict.fromkeys(i // self.page_size for i in indices))
+            # max_pages at a time so a long slice doesn't push its own pages out before they're read
+            pages = {}
+            for start in range(0, len(numbers), self.max_pages):
+                self._load_pages(numbers[start:start + self.max_pages])
+                for number in numbers[start:start + self.max_pages]:
+                    pages[number] = self._page(number)
+            return [self._build(pages[i // self.page_size][i % self.page_size]) for i in indices]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("TrackCollection index out of range")
+        items = self._page(index // self.page_size)
+        return self._build(items[index % self.page_size])
+
+    def __iter__(self) -> Iterator:
+        items = self._api.iter_playlist_tracks(self.playlist_id, fields=_track_fields(self.fields), market=self.market)
+        for item in items:
+            track = self._build(item)
+            if track is not None:
+                yield track
+
+    def __repr__(self) -> str:
+        return f"TrackCollection('{self.playlist_id}') # {self._total if self._total is not None else '?'} tracks"
@@ -1,18 +1,208 @@
+from typing import *
+
+try:
+    import numpy as np
+except ImportError:  # only needed for the bulk parse_ids / validate_ids / format_ids
+    np = None
 
 b62_digits = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_b62_values = {digit: value for value, digit in enumerate(b62_digits)}
+_b62_pairs = [high + low for high in b62_digits for low in b62_digits]  # format_id does two digits at a time
+# spotify ids are 128 bit numbers written as 22 base62 digits, 62**22 is a little over 2**131 so not every
+# 22 character base62 string is one
+_id_limit = 1 << 128
 
 
 def get_id(id) :
-    new_id = id[-22:]
-    return new_id
+    ''' the id out of an id, a SpotifyID, a spotify:track:... uri or an open.spotify.com/... url (query strings and all) '''
+    if type(id) is str:
+        # plain ids, uris and urls without a query string, the common cases
+        if len(id) == 22 or (id[-23:-22] in (":", "/") and "?" not in id and "#" not in id):
+            return id[-22:]
+    elif isinstance(id, int):
+        return format_id(id)
+    id = id.split("?", 1)[0].split("#", 1)[0].rstrip("/")
+    return id[max(id.rfind("/"), id.rfind(":")) + 1:]
+
 
 def is_base62(id):
-    b62 = True
-    for letter in id :
-        if letter not in b62_digits:
-            b62 = False
-            break
-    return b62
+    # isalnum alone would let through non ascii letters and digits
+    return id.isascii() and (id.isalnum() or not id)
+
 
 def is_id(id) :
     return len(id) == 22 and is_base62(id)
+
+
+def decode_id(id: str) -> int:
+    ''' the 128 bit number a 22 character id stands for, ValueError if it isn't one '''
+    if len(id) != 22:
+        raise ValueError(f"{id!r} is not a spotify id")
+    value = 0
+    try:
+        for digit in id:
+            value = value * 62 + _b62_values[digit]
+    except KeyError:
+        raise ValueError(f"{id!r} is not a spotify id") from None
+    if value >= _id_limit:
+        raise ValueError(f"{id!r} is not a spotify id")
+    return value
+
+
+def format_id(value: int) -> str:
+    ''' the 22 character id for a 128 bit number '''
+    if not 0 <= value < _id_limit:
+        raise ValueError(f"{value} doesn't fit in a spotify id")
+    pairs = []
+    for _ in range(11):
+        value, pair = divmod(value, 3844)
+        pairs.append(_b62_pairs[pair])
+    return "".join(reversed(pairs))
+
+
+class SpotifyID(int):
+    '''
+    an id as the 128 bit number it stands for, it's an int so it hashes and compares like one and takes less
+    memory than the 22 character string. str() gives the id back
+
+        SpotifyID("https://open.spotify.com/track/6rqhFgbbKwnb9MLmUQDhG6?si=abc") == SpotifyID("6rqhFgbbKwnb9MLmUQDhG6")
+    '''
+
+    __slots__ = ()
+
+    def __new__(cls, id: Union[str, int]):
+        if isinstance(id, int):
+            if not 0 <= id < _id_limit:
+                raise ValueError(f"{id} doesn't fit in a spotify id")
+            return int.__new__(cls, id)
+        return int.__new__(cls, decode_id(get_id(id)))
+
+    def __str__(self):
+        return format_id(self)
+
+    def __repr__(self):
+        return f"SpotifyID('{self}')"
+
+    def __format__(self, spec):
+        return format(str(self), spec) if not spec or spec[-1] == "s" else int.__format__(self, spec)
+
+    def uri(self, kind: str) -> str:
+        return f"spotify:{kind}:{self}"
+
+    def url(self, kind: str) -> str:
+        return f"https://open.spotify.com/{kind}/{self}"
+
+
+# -- bulk, numpy --
+# ids are handled as (n, 2) uint64 arrays of [high, low] halves. the arithmetic is done on four 32 bit limbs
+# per id kept in uint64 so a limb times 62**5 plus the carry never overflows
+
+_limb_mask = np.uint64(0xFFFFFFFF) if np is not None else None
+_digit_groups = ((0, 2), (2, 7), (7, 12), (12, 17), (17, 22))
+_block_size = 1 << 14
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("bulk id parsing requires numpy to be installed")
+
+
+def _decode_ids(ids: Sequence[str]) -> tuple:
+    ''' (values, valid) for ids that are already just ids, values of invalid ones are 0 '''
+    _require_numpy()
+    values = np.zeros((len(ids), 2), dtype=np.uint64)
+    valid = np.zeros(len(ids), dtype=bool)
+    # in blocks so the temporaries stay in cache, a lot faster than whole arrays of millions
+    for start in range(0, len(ids), _block_size):
+        block = slice(start, start + _block_size)
+        values[block], valid[block] = _decode_block(ids[block])
+    return values, valid
+
+
+def _decode_block(ids: Sequence[str]) -> tuple:
+    n = len(ids)
+    lengths = np.fromiter(map(len, ids), dtype=np.intp, count=n)
+    # longer strings get cut to 22 and shorter ones padded with "\0", both are caught by lengths/the lookup table
+    codepoints = np.array(ids, dtype="U22").view(np.uint32).reshape(n, 22)
+    np.minimum(codepoints, 127, out=codepoints)
+    table = np.full(128, 255, dtype=np.uint8)
+    table[np.frombuffer(b62_digits.encode(), dtype=np.uint8)] = np.arange(62, dtype=np.uint8)
+    digits = table[codepoints]
+    valid = (lengths == 22) & (digits != 255).all(axis=1)
+    # one row per digit position, the 255s of invalid ids can't overflow anything and their rows are zeroed below
+    digits = digits.T.astype(np.uint64)
+
+    limbs = np.zeros((4, n), dtype=np.uint64)
+    overflow = np.zeros(n, dtype=bool)
+    shift = np.uint64(32)
+    for start, stop in _digit_groups:
+        # up to 5 digits at a time
+        carry = digits[start]
+        for position in range(start + 1, stop):
+            carry = carry * np.uint64(62) + digits[position]
+        base = np.uint64(62 ** (stop - start))
+        for k in range(4):
+            total = limbs[k] * base + carry
+            limbs[k] = total & _limb_mask
+            carry = total >> shift
+        overflow |= carry != 0
+    valid &= ~overflow
+    values = np.empty((n, 2), dtype=np.uint64)
+    values[:, 0] = (limbs[3] << shift) | limbs[2]
+    values[:, 1] = (limbs[1] << shift) | limbs[0]
+    values[~valid] = 0
+    return values, valid
+
+
+def _plain_ids(ids: Iterable) -> list:
+    return [id if isinstance(id, str) and len(id) == 22 else get_id(id) for id in ids]
+
+
+def validate_ids(ids: Iterable) -> "np.ndarray":
+    ''' boolean array, which of ids (ids, uris or urls) are spotify ids. millions at a time, needs numpy '''
+    return _decode_ids(_plain_ids(ids))[1]
+
+
+def parse_ids(ids: Iterable, errors: str = "raise") -> "np.ndarray":
+    '''
+    ids, uris or urls as an (n, 2) uint64 array of [high, low] 64 bit halves, needs numpy.
+    errors="raise" raises ValueError naming the first invalid one, errors="zero" leaves their rows 0
+    (use validate_ids for the mask)
+    '''
+    if errors not in ("raise", "zero"):
+        raise ValueError(f'errors must be "raise" or "zero" not "{errors}"')
+    ids = _plain_ids(ids)
+    values, valid = _decode_ids(ids)
+    if errors == "raise" and not valid.all():
+        raise ValueError(f"{ids[int(np.argmin(valid))]!r} is not a spotify id")
+    return values
+
+
+def format_ids(values: "np.ndarray") -> list:
+    ''' the 22 character ids for an (n, 2) uint64 array from parse_ids '''
+    _require_numpy()
+    values = np.asarray(values, dtype=np.uint64).reshape(-1, 2)
+    ids = []
+    for start in range(0, len(values), _block_size):
+        ids.extend(_format_block(values[start:start + _block_size]))
+    return ids
+
+
+def _format_block(values: "np.ndarray") -> list:
+    n = len(values)
+    shift = np.uint64(32)
+    limbs = [values[:, 0] >> shift, values[:, 0] & _limb_mask, values[:, 1] >> shift, values[:, 1] & _limb_mask]
+    digits = np.empty((n, 22), dtype=np.uint8)
+    base62 = np.uint64(62)
+    for start, stop in reversed(_digit_groups):
+        # long division of the four limbs by 62**width, highest first, the remainder is the next few digits
+        base = np.uint64(62 ** (stop - start))
+        remainder = np.zeros(n, dtype=np.uint64)
+        for k in range(4):
+            current = (remainder << shift) | limbs[k]
+            limbs[k] = current // base
+            remainder = current % base
+        for column in range(stop - 1, start - 1, -1):
+            remainder, digits[:, column] = np.divmod(remainder, base62)
+    alphabet = np.frombuffer(b62_digits.encode(), dtype=np.uint8)
+    return alphabet[digits].view("S22").ravel().astype("U22").tolist()
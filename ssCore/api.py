@@ -3,31 +3,74 @@ from typing import *
 import requests
 import abc
 from .ssexceptions import *
+from .IDtools import is_id
+from .scheduler import RequestScheduler
+from .responsecache import ResponseCache
+from .transport import default_transport
+from .instrumentation import Instrumentation, default_instrumentation, endpoint_name, response_size
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice
+import threading
+import time
 
 attributes = ("acousticness", "danceability", "duration_ms",
                           "energy", "instrumentalness", "key", "liveness", "loudness", "mode", "popularity", "speechiness", "tempo", "time_signature", "valence")
+default_base_url = "https://api.spotify.com/v1"
+# the most ids spotify accepts in one call to each of the multiple_* endpoints, keyed by the response key
+multiple_limits = {"albums": 20, "artists": 50, "tracks": 50, "audio_features": 100}
+
+# set in the api worker threads so nested calls run inline instead of waiting on their own pool
+_worker = threading.local()
+
+
+def _mark_worker():
+    _worker.inside = True
+
+
+def _chunks(ids: list, size: int) -> list:
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def _page_offsets(first_page: dict, limit: int, max_total: Optional[int] = None):
+    ''' offsets of every page after the first, None if the total isn't known and we have to follow "next" '''
+    total = first_page.get('total')
+    if total is None:
+        return None
+    if max_total is not None:
+        total = min(total, max_total)
+    return iter(range(limit, total, limit))
+
+
 def _get_session(self) :
     if self._passed_session is not None :
         return self._passed_session
-    if not hasattr(self,"_session") :
-        self._session = requests.session()
-    return self._session
+    return default_transport()
 
 
 class APIbase(abc.ABC):
     ''' Base Class for all API classes '''
 
-    def __init__(self, tokenbearer : TokenBearer, session: Optional[requests.Session] = None):
+    def __init__(self, tokenbearer : TokenBearer, session: Optional[requests.Session] = None,
+                 base_url: str = default_base_url, instrumentation: Optional[Instrumentation] = None):
         self.tokenbearer = tokenbearer
         self._passed_session = session
+        self.base_url = base_url.rstrip("/")  # point it at a stand-in server (see fakeserver.py) for offline runs
+        self._instrumentation = instrumentation
+
+    @property
+    def instrumentation(self) -> Instrumentation:
+        # its own if it was given one, otherwise whatever set_default_instrumentation set (nothing by default)
+        if self._instrumentation is not None:
+            return self._instrumentation
+        return default_instrumentation()
 
     @property
     def session(self):
+        # everything shares one pooled transport unless it was given its own session
         if self._passed_session is not None:
             return self._passed_session
-        if not hasattr(self, "_session"):
-            self._session = requests.session()
-        return self._session
+        return default_transport()
 
     # These are all the "ENDPOINTS" you need to implement if you want to create a compatible API class (in a way this
     # this is the API for API's) All of them should return the JSON response just as it came from the spotify API
@@ -116,17 +159,111 @@ class APIbase(abc.ABC):
 
 class SimpleSpotifyApi(APIbase) :
 
+    def __init__(self, tokenbearer : TokenBearer, session: Optional[requests.Session] = None, max_workers: int = 8,
+                 prefetch: int = 4, scheduler: Optional[RequestScheduler] = None,
+                 response_cache: Optional[ResponseCache] = None, fast_decode: bool = False,
+                 base_url: str = default_base_url, instrumentation: Optional[Instrumentation] = None):
+        APIbase.__init__(self, tokenbearer, session=session, base_url=base_url, instrumentation=instrumentation)
+        self.response_cache = response_cache
+        # fast_decode decodes responses into the typed records in decoding.py instead of dicts, needs msgspec
+        self.decoders = None
+        if fast_decode:
+            try:
+                from .decoding import decoders
+            except ImportError:
+                raise SSExcept("fast_decode requires msgspec to be installed")
+            self.decoders = decoders
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.max_workers = max_workers
+        self.prefetch = prefetch  # how many pages the iter_* methods fetch ahead of the consumer
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
     # --INTERNALS --
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, initializer=_mark_worker,
+                                                    thread_name_prefix="simplespotify")
+        return self._executor
+
+    def _map(self, func, items: list) -> list:
+        ''' runs func over items on the worker pool, results come back in the same order as items '''
+        if len(items) <= 1 or getattr(_worker, "inside", False):
+            return [func(item) for item in items]
+        return list(self.executor.map(func, items))
+
+    def _decode(self, r, kind: str):
+        ''' the response body as a typed record of the given kind if fast_decode is on, as a dict otherwise '''
+        if self.decoders is None:
+            return r.json()
+        return self.decoders[kind].decode(r.content)
+
+    def _get_multiple(self, url: str, key: str, ids: list, params: Optional[dict] = None) -> dict:
+        '''
+        splits ids into chunks spotify will accept, fetches them in parallel and stitches the results back together
+        in the order of ids. anything that isn't a valid id comes back as None just like unknown ids do
+        '''
+        ids = list(ids)
+        valid = [id for id in ids if is_id(id)]
+
+        def fetch(chunk):
+            chunk_params = dict(params or {})
+            chunk_params["ids"] = ",".join(chunk)
+            return self._decode(self._get(url=url, params=chunk_params), "multiple_" + key)[key]
+
+        found = {}
+        for chunk, items in zip(_chunks(valid, multiple_limits[key]),
+                                self._map(fetch, _chunks(valid, multiple_limits[key]))):
+            found.update(zip(chunk, items))
+        return {key: [found.get(id) for id in ids]}
+
     def auth_headers(self):
         return {"Authorization": f"Bearer { self.tokenbearer._get_token() }"}
 
-    def _get(self, *args, **kwargs):
-        kwargs.update({"headers": self.auth_headers()})
+    def _get(self, url, params=None):
+        if self.response_cache is None:
+            return self._send(url, params)
+        return self.response_cache.get(url, params, self._send)
+
+    def _send(self, url, params=None, headers=None, stream=False):
+        def request():
+            # headers are rebuilt on every attempt in case the token was refreshed while we were backing off
+            request_headers = self.auth_headers()
+            if headers:
+                request_headers.update(headers)
+            return self.session.get(url, params=params, headers=request_headers, stream=stream)
+
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled:
+            return self._check(self.scheduler.send(request), headers)
+
+        endpoint = endpoint_name(url, self.base_url)
+        attempts = 0
+
+        def timed_request():
+            nonlocal attempts
+            start = time.perf_counter()
+            r = request()
+            instrumentation.on_request(endpoint, r.status_code, time.perf_counter() - start,
+                                       response_size(r, stream), attempts)
+            attempts += 1
+            return r
 
-        r = self.session.get(*args, **kwargs)
+        with instrumentation.span(f"GET {endpoint}", {"http.method": "GET", "http.url": url,
+                                                      "spotify.endpoint": endpoint}) as span:
+            r = self.scheduler.send(timed_request)
+            span.set_attribute("http.status_code", r.status_code)
+            span.set_attribute("spotify.retries", attempts - 1)
+            return self._check(r, headers)
 
+    def _check(self, r, headers=None):
+        ''' r if it's usable, raises for everything else '''
         if r.status_code == 200:  # ok
             return r
+        elif r.status_code == 304 and headers:  # not modified, only when the response cache asked for it
+            return r
         elif r.status_code == 400:  # bad request
             #print(r.content)
             #r.raise_for_status()
@@ -161,7 +298,7 @@ class SimpleSpotifyApi(APIbase) :
                 raise TypeError(f"Unexpected Keyword Argument {kwarg}")
             params.update({kwarg: kwargs[kwarg]})
 
-        r = self._get(url ="https://api.spotify.com/v1/recommendations",
+        r = self._get(url = f"{self.base_url}/recommendations",
                       params = params)
 
         return r.json()
@@ -170,37 +307,37 @@ class SimpleSpotifyApi(APIbase) :
 
         # request
         resp = self._get(
-            url = "https://api.spotify.com/v1/browse/new-releases",
+            url = f"{self.base_url}/browse/new-releases",
             params = {"country": country,
                       "limit": limit,
                       "offset": offset, }
         )
         # Return paged item. ['items'] is the list of album objects
         # paged item contains ['href', 'items', 'limit', 'next', 'offset', 'previous', 'total']
-        return resp.json()['albums']
+        return self._decode(resp, "new_releases")['albums']
 
     def featured_playlists(self, locale: Optional[str] = None, country: Optional[str] = None,
                            timestamp: Optional[str] = None,
                            limit: int = 20, offset: int = 0):
-        r = self._get("https://api.spotify.com/v1/browse/featured-playlists",
+        r = self._get(f"{self.base_url}/browse/featured-playlists",
                       params= {"locale": locale, "country": country, "timestamp": timestamp,
                                "limit": limit, "offset": offset})
         return r.json()
 
     def list_categories(self, limit: int= 20, offset: int = 0, country: Optional[str] = None, locale: Optional[str] = None):
-        r = self._get("https://api.spotify.com/v1/browse/categories",
+        r = self._get(f"{self.base_url}/browse/categories",
                       params = {"limit": limit, "offset": offset,
                                 "country": country, "locale": locale})
         return r.json()
 
     def get_category(self, category_id: str, country:Optional[str]=None, locale:Optional[str]=None):
-        r = self._get(f"https://api.spotify.com/v1/browse/categories/{category_id}",
+        r = self._get(f"{self.base_url}/browse/categories/{category_id}",
                       params={"country": country, "locale": locale})
         return r.json()
 
     def category_playlists(self, category_id: str, limit: int = 20, offset: int = 0, country: Optional[str]=None):
 
-        r = self._get(url = f"https://api.spotify.com/v1/browse/categories/{category_id}/playlists",
+        r = self._get(url = f"{self.base_url}/browse/categories/{category_id}/playlists",
                       params = {
                           "limit": limit,
                           "offset": offset,
@@ -217,7 +354,7 @@ class SimpleSpotifyApi(APIbase) :
         if include_external :
             params.update({"include_external": "audio"})
 
-        r = self._get( url = "https://api.spotify.com/v1/search",
+        r = self._get( url = f"{self.base_url}/search",
                        params = params)
 
         return r.json()
@@ -225,93 +362,174 @@ class SimpleSpotifyApi(APIbase) :
     # --ALBUM ENDPOINTS-- COMPLETE
     def single_album(self, id: str):
         # TODO add id parsing tools -> id is base 62 encoded
-        resp = self._get(f"https://api.spotify.com/v1/albums/{id}")
+        resp = self._get(f"{self.base_url}/albums/{id}")
 
-        return resp.json()
+        return self._decode(resp, "album")
 
     def multiple_albums(self, ids: list, market: Optional[str] = None):
-        r = self._get(url = "https://api.spotify.com/v1/albums",
-                      params = {
-                          "ids": ",".join(ids),
-                          "market": market
-                      })
-        return r.json()
+        return self._get_multiple(f"{self.base_url}/albums", "albums", ids,
+                                  params = {"market": market})
 
     def get_album_tracks(self, id: str, limit: int = 50, offset: int = 0, market:Optional[str]= None):
 
-        r = self._get(url = f"https://api.spotify.com/v1/albums/{id}/tracks",
+        r = self._get(url = f"{self.base_url}/albums/{id}/tracks",
                       params = {
                           "limit": limit,
                           "offset": offset,
                           "market": market}
                       )
 
-        return r.json()
+        return self._decode(r, "track_page")
 
     # --ARTIST ENDPOINTS-- COMPLETE
     def single_artist(self, id: str):
-        resp = self._get(f"https://api.spotify.com/v1/artists/{id}")
-        return resp.json()
+        resp = self._get(f"{self.base_url}/artists/{id}")
+        return self._decode(resp, "artist")
 
     def multiple_artists(self, ids: list):
-        r = self._get(url="https://api.spotify.com/v1/artists",
-                      params={"ids"   : ','.join(ids)})
-        return r.json()
+        return self._get_multiple(f"{self.base_url}/artists", "artists", ids)
 
     def artist_top_tracks(self, id: str, market: str="US"):
-        r = self._get(url=f"https://api.spotify.com/v1/artists/{id}/top-tracks",
+        r = self._get(url=f"{self.base_url}/artists/{id}/top-tracks",
                       params={"market":market})
-        return r.json()
+        return self._decode(r, "top_tracks")
 
     def artist_related_artists(self, id: str):
-        r = self._get(f"https://api.spotify.com/v1/artists/{id}/related-artists")
-        return r.json()
+        r = self._get(f"{self.base_url}/artists/{id}/related-artists")
+        return self._decode(r, "related_artists")
 
     def get_artist_albums(self, id: str, include_groups: Optional[str] = None, market: Optional[str] = None,limit: int = 20, offset: int = 0):
-        r = self._get(f"https://api.spotify.com/v1/artists/{id}/albums",
+        r = self._get(f"{self.base_url}/artists/{id}/albums",
                       params = {"include_groups": include_groups,
                                 "market": market,
                                 "limit": limit,
                                 "offset": offset})
-        return r.json()
+        return self._decode(r, "album_page")
 
     # --TRACK ENDPOINTS-- COMPLETE
     def single_track(self, id: str, market: Optional[str] = None):
-        resp = self._get(f"https://api.spotify.com/v1/tracks/{id}",
+        resp = self._get(f"{self.base_url}/tracks/{id}",
                          params={"market": market})
-        return resp.json()
+        return self._decode(resp, "track")
 
     def multiple_tracks(self, ids: list, market: Optional[str] = None):
-        r = self._get(url = "https://api.spotify.com/v1/tracks",
-                      params = {"ids": ','.join(ids),
-                                "market": market})
-        return r.json()
+        return self._get_multiple(f"{self.base_url}/tracks", "tracks", ids,
+                                  params = {"market": market})
 
     def single_track_audio_features(self, id: str):
-        r = self._get(f"https://api.spotify.com/v1/audio-features/{id}")
-        return r.json()
+        r = self._get(f"{self.base_url}/audio-features/{id}")
+        return self._decode(r, "audio_features")
 
     def multiple_track_audio_features(self, ids: list):
-        r = self._get("https://api.spotify.com/v1/audio-features",
-                      params={"ids": ",".join(ids)})
-        return r.json()
+        return self._get_multiple(f"{self.base_url}/audio-features", "audio_features", ids)
 
     def track_audio_analysis(self, id: str):
-        r = self._get(f"https://api.spotify.com/v1/audio-analysis/{id}")
+        r = self._get(f"{self.base_url}/audio-analysis/{id}")
         return r.json()
 
+    def stream_track_audio_analysis(self, id: str):
+        ''' the audio analysis body as a file object so it can be parsed while it downloads, skips the response cache '''
+        r = self._send(f"{self.base_url}/audio-analysis/{id}", stream=True)
+        r.raw.decode_content = True
+        return r.raw
+
     # -- PLAYLIST ENDPOINTS --
 
     def single_playlist(self, id, fields=None, market = None) :
-        r = self._get(f"https://api.spotify.com/v1/playlists/{id}",
+        r = self._get(f"{self.base_url}/playlists/{id}",
+                      params = {
+                          "fields": fields,
+                          "market": market
+                                })
+        # a fields filter leaves out parts of the playlist record, those stay plain dicts
+        return self._decode(r, "playlist") if fields is None else r.json()
+
+    def playlist_tracks(self, id, fields=None, limit: int = 100, offset: int = 0, market=None):
+        r = self._get(f"{self.base_url}/playlists/{id}/tracks",
                       params = {
                           "fields": fields,
+                          "limit": limit,
+                          "offset": offset,
                           "market": market
                                 })
         return r.json()
 
     def playlist_cover_image(self, playlist_id ):  # why is this endpoint even needed? the normal playllist endpoint returns it aswell
         # OAUTH REQUIRED IT RETURNS BAD REQUEST CAUSE API RESPONSE IS STUPID
-        r = self._get("https://api.spotify.com/v1/playlists/{}/images".format(playlist_id))
+        r = self._get(f"{self.base_url}/playlists/{playlist_id}/images")
         return r.json()
 
+    # -- PAGING --
+    # iter_* versions of the paging endpoints yield every item across all pages. once the first page tells us the
+    # total the next `prefetch` pages are fetched in the background while the current one is consumed
+
+    def _iter_pages(self, fetch, limit: int = 50, prefetch: Optional[int] = None, max_total: Optional[int] = None):
+        ''' fetch(limit, offset) should return a paging object '''
+        prefetch = self.prefetch if prefetch is None else prefetch
+
+        page = fetch(limit, 0)
+        yield from page['items']
+
+        offsets = _page_offsets(page, limit, max_total)
+        if offsets is None or prefetch < 1 or getattr(_worker, "inside", False):
+            offset = limit
+            while page.get('next') and (max_total is None or offset < max_total):
+                page = fetch(limit, offset)
+                yield from page['items']
+                offset += limit
+            return
+
+        futures = deque(self.executor.submit(fetch, limit, offset) for offset in islice(offsets, prefetch))
+        try:
+            while futures:
+                page = futures.popleft().result()
+                for offset in islice(offsets, 1):
+                    futures.append(self.executor.submit(fetch, limit, offset))
+                yield from page['items']
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def iter_album_tracks(self, id: str, market: Optional[str] = None, prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.get_album_tracks(id, limit=limit, offset=offset, market=market),
+                                limit=50, prefetch=prefetch)
+
+    def iter_artist_albums(self, id: str, include_groups: Optional[str] = None, market: Optional[str] = None,
+                           prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.get_artist_albums(id, include_groups=include_groups, market=market,
+                                                                             limit=limit, offset=offset),
+                                limit=50, prefetch=prefetch)
+
+    def iter_playlist_tracks(self, id: str, fields: Optional[str] = None, market: Optional[str] = None,
+                             prefetch: Optional[int] = None):
+        ''' a fields filter has to keep total (or next) or only the first page comes back '''
+        return self._iter_pages(lambda limit, offset: self.playlist_tracks(id, fields=fields, limit=limit, offset=offset,
+                                                                           market=market),
+                                limit=100, prefetch=prefetch)
+
+    def iter_category_playlists(self, category_id: str, country: Optional[str] = None, prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.category_playlists(category_id, limit=limit, offset=offset,
+                                                                              country=country)['playlists'],
+                                limit=50, prefetch=prefetch)
+
+    def iter_categories(self, country: Optional[str] = None, locale: Optional[str] = None, prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.list_categories(limit=limit, offset=offset, country=country,
+                                                                           locale=locale)['categories'],
+                                limit=50, prefetch=prefetch)
+
+    def iter_featured_playlists(self, locale: Optional[str] = None, country: Optional[str] = None,
+                                timestamp: Optional[str] = None, prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.featured_playlists(locale=locale, country=country, timestamp=timestamp,
+                                                                              limit=limit, offset=offset)['playlists'],
+                                limit=50, prefetch=prefetch)
+
+    def iter_new_releases(self, country: Optional[str] = None, prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.get_new_releases(country=country, limit=limit, offset=offset),
+                                limit=50, prefetch=prefetch)
+
+    def iter_search(self, q: str, type: str, market: Optional[str] = None, include_external: bool = False,
+                    prefetch: Optional[int] = None):
+        ''' only one type at a time, spotify won't page search results past 1000 '''
+        return self._iter_pages(lambda limit, offset: self.search(q, type, market=market, limit=limit, offset=offset,
+                                                                  include_external=include_external)[type + "s"],
+                                limit=50, prefetch=prefetch, max_total=1000)
@@ -0,0 +1,315 @@
+from .api import APIbase, attributes, multiple_limits, default_base_url, _chunks, _page_offsets
+from .tokenbearers import TokenBearer
+from .scheduler import RequestScheduler
+from .IDtools import is_id
+from .instrumentation import Instrumentation, endpoint_name
+from typing import *
+from .ssexceptions import *
+from collections import deque
+from itertools import islice
+import asyncio
+import time
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is only needed for the async backend
+    aiohttp = None
+
+
+def _clean_params(params: Optional[dict]):
+    # aiohttp refuses None values (requests silently drops them), so strip them here
+    if params is None:
+        return None
+    return {k: v for k, v in params.items() if v is not None}
+
+
+class AsyncSimpleSpotifyApi(APIbase):
+    ''' asyncio version of SimpleSpotifyApi, every endpoint is a coroutine that returns the same JSON as the sync one '''
+
+    def __init__(self, tokenbearer: TokenBearer, session=None, limit_per_host: int = 100, prefetch: int = 4,
+                 scheduler: Optional[RequestScheduler] = None, base_url: str = default_base_url,
+                 instrumentation: Optional[Instrumentation] = None):
+        if aiohttp is None:
+            raise SSExcept("AsyncSimpleSpotifyApi requires aiohttp to be installed")
+        APIbase.__init__(self, tokenbearer, session=session, base_url=base_url, instrumentation=instrumentation)
+        # 429s wait out Retry-After and 5xx are retried with backoff, see RequestScheduler.send_async
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.limit_per_host = limit_per_host
+        self.prefetch = prefetch
+
+    @property
+    def session(self):
+        # aiohttp sessions have to be created inside a running event loop so this is only called from _get
+        if self._passed_session is not None:
+            return self._passed_session
+        if getattr(self, "_session", None) is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.limit_per_host))
+        return self._session
+
+    async def close(self):
+        if getattr(self, "_session", None) is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # --INTERNALS --
+    async def auth_headers(self):
+        get_token_async = getattr(self.tokenbearer, "_get_token_async", None)
+        if get_token_async is None:
+            # bearers that only have _get_token (TokenBearer's __subclasshook__ lets them in) may block on a refresh
+            token = await asyncio.get_running_loop().run_in_executor(None, self.tokenbearer._get_token)
+        else:
+            token = await get_token_async()
+        return {"Authorization": f"Bearer {token}"}
+
+    async def _get(self, url, params=None):
+        ''' unlike SimpleSpotifyApi._get this returns the decoded JSON, the response is released on return '''
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled:
+            return await self._send(url, params)
+
+        endpoint = endpoint_name(url, self.base_url)
+        with instrumentation.span(f"GET {endpoint}", {"http.method": "GET", "http.url": url,
+                                                      "spotify.endpoint": endpoint}) as span:
+            return await self._send(url, params, instrumentation, endpoint, span)
+
+    async def _send(self, url, params=None, instrumentation=None, endpoint=None, span=None):
+        attempts = 0
+
+        async def request():
+            nonlocal attempts
+            # headers are rebuilt on every attempt in case the token was refreshed while we were backing off
+            headers = await self.auth_headers()
+            start = time.perf_counter()
+            async with self.session.get(url, params=_clean_params(params), headers=headers) as r:
+                # read before the connection goes back to the pool, json() below decodes what was read
+                body = await r.read()
+            if instrumentation is not None:
+                instrumentation.on_request(endpoint, r.status, time.perf_counter() - start, len(body), attempts)
+            attempts += 1
+            return r
+
+        r = await self.scheduler.send_async(request)
+        if span is not None:
+            span.set_attribute("http.status_code", r.status)
+            span.set_attribute("spotify.retries", attempts - 1)
+        if r.status == 200:  # ok
+            return await r.json()
+        elif r.status == 400:  # bad request
+            body = await r.json()
+            raise SSExcept(f"Error 400 Bad Request: {body['error']['message']}")
+        elif r.status == 401:
+            body = await r.json()
+            raise ClientExcept(f"Error 401 Unauthorized: {body['error']['message']}")
+        else:  # other
+            r.raise_for_status()
+
+    async def _get_multiple(self, url: str, key: str, ids: list, params: Optional[dict] = None) -> dict:
+        ''' same as SimpleSpotifyApi._get_multiple but the chunks are gathered on the event loop '''
+        ids = list(ids)
+        chunks = _chunks([id for id in ids if is_id(id)], multiple_limits[key])
+
+        async def fetch(chunk):
+            chunk_params = dict(params or {})
+            chunk_params["ids"] = ",".join(chunk)
+            return (await self._get(url, params=chunk_params))[key]
+
+        found = {}
+        for chunk, items in zip(chunks, await asyncio.gather(*(fetch(chunk) for chunk in chunks))):
+            found.update(zip(chunk, items))
+        return {key: [found.get(id) for id in ids]}
+
+    # --BROWSE ENDPOINTS--
+
+    async def get_seeded_recommendations(self, limit: int = 20, offset: int = 0, seed_artists: list = None,
+                                         seed_genres: list = None, seed_tracks: list = None, market: str = None,
+                                         **kwargs):
+        params = {"limit": limit, "offset": offset, "market": market}
+
+        if seed_artists is not None:
+            params.update({"seed_artists": ",".join(seed_artists)})
+        if seed_genres is not None:
+            params.update({"seed_genres": ",".join(seed_genres)})
+        if seed_tracks is not None:
+            params.update({"seed_tracks": ",".join(seed_tracks)})
+
+        for kwarg in kwargs:
+            if not kwarg.startswith(("min_", "max_", "target_")) or not kwarg.endswith(attributes):
+                raise TypeError(f"Unexpected Keyword Argument {kwarg}")
+            params.update({kwarg: kwargs[kwarg]})
+
+        return await self._get(f"{self.base_url}/recommendations", params=params)
+
+    async def get_new_releases(self, country: Optional[str] = None, limit: int = 20, offset: int = 0):
+        resp = await self._get(f"{self.base_url}/browse/new-releases",
+                               params={"country": country, "limit": limit, "offset": offset})
+        return resp['albums']
+
+    async def featured_playlists(self, locale: Optional[str] = None, country: Optional[str] = None,
+                                 timestamp: Optional[str] = None, limit: int = 20, offset: int = 0):
+        return await self._get(f"{self.base_url}/browse/featured-playlists",
+                               params={"locale": locale, "country": country, "timestamp": timestamp,
+                                       "limit": limit, "offset": offset})
+
+    async def list_categories(self, limit: int = 20, offset: int = 0, country: Optional[str] = None,
+                              locale: Optional[str] = None):
+        return await self._get(f"{self.base_url}/browse/categories",
+                               params={"limit": limit, "offset": offset, "country": country, "locale": locale})
+
+    async def get_category(self, category_id: str, country: Optional[str] = None, locale: Optional[str] = None):
+        return await self._get(f"{self.base_url}/browse/categories/{category_id}",
+                               params={"country": country, "locale": locale})
+
+    async def category_playlists(self, category_id: str, limit: int = 20, offset: int = 0,
+                                 country: Optional[str] = None):
+        return await self._get(f"{self.base_url}/browse/categories/{category_id}/playlists",
+                               params={"limit": limit, "offset": offset, "country": country})
+
+    async def search(self, q: str, types: str, market: Optional[str] = None, limit: int = 20, offset: int = 0,
+                     include_external: bool = False):
+        params = {"q": q, "type": types, "market": market, "limit": limit, "offset": offset}
+        if include_external:
+            params.update({"include_external": "audio"})
+        return await self._get(f"{self.base_url}/search", params=params)
+
+    # --ALBUM ENDPOINTS--
+    async def single_album(self, id: str):
+        return await self._get(f"{self.base_url}/albums/{id}")
+
+    async def multiple_albums(self, ids: list, market: Optional[str] = None):
+        return await self._get_multiple(f"{self.base_url}/albums", "albums", ids,
+                                        params={"market": market})
+
+    async def get_album_tracks(self, id: str, limit: int = 50, offset: int = 0, market: Optional[str] = None):
+        return await self._get(f"{self.base_url}/albums/{id}/tracks",
+                               params={"limit": limit, "offset": offset, "market": market})
+
+    # --ARTIST ENDPOINTS--
+    async def single_artist(self, id: str):
+        return await self._get(f"{self.base_url}/artists/{id}")
+
+    async def multiple_artists(self, ids: list):
+        return await self._get_multiple(f"{self.base_url}/artists", "artists", ids)
+
+    async def artist_top_tracks(self, id: str, market: str = "US"):
+        return await self._get(f"{self.base_url}/artists/{id}/top-tracks", params={"market": market})
+
+    async def artist_related_artists(self, id: str):
+        return await self._get(f"{self.base_url}/artists/{id}/related-artists")
+
+    async def get_artist_albums(self, id: str, include_groups: Optional[str] = None, market: Optional[str] = None,
+                                limit: int = 20, offset: int = 0):
+        return await self._get(f"{self.base_url}/artists/{id}/albums",
+                               params={"include_groups": include_groups, "market": market,
+                                       "limit": limit, "offset": offset})
+
+    # --TRACK ENDPOINTS--
+    async def single_track(self, id: str, market: Optional[str] = None):
+        return await self._get(f"{self.base_url}/tracks/{id}", params={"market": market})
+
+    async def multiple_tracks(self, ids: list, market: Optional[str] = None):
+        return await self._get_multiple(f"{self.base_url}/tracks", "tracks", ids,
+                                        params={"market": market})
+
+    async def single_track_audio_features(self, id: str):
+        return await self._get(f"{self.base_url}/audio-features/{id}")
+
+    async def multiple_track_audio_features(self, ids: list):
+        return await self._get_multiple(f"{self.base_url}/audio-features", "audio_features", ids)
+
+    async def track_audio_analysis(self, id: str):
+        return await self._get(f"{self.base_url}/audio-analysis/{id}")
+
+    # -- PLAYLIST ENDPOINTS --
+    async def single_playlist(self, id, fields=None, market=None):
+        return await self._get(f"{self.base_url}/playlists/{id}",
+                               params={"fields": fields, "market": market})
+
+    async def playlist_tracks(self, id, fields=None, limit: int = 100, offset: int = 0, market=None):
+        return await self._get(f"{self.base_url}/playlists/{id}/tracks",
+                               params={"fields": fields, "limit": limit, "offset": offset, "market": market})
+
+    async def playlist_cover_image(self, playlist_id):
+        return await self._get(f"{self.base_url}/playlists/{playlist_id}/images")
+
+    # -- PAGING --
+    # async generator versions of SimpleSpotifyApi.iter_*, upcoming pages are fetched as tasks ahead of the consumer
+
+    async def _iter_pages(self, fetch, limit: int = 50, prefetch: Optional[int] = None, max_total: Optional[int] = None):
+        prefetch = self.prefetch if prefetch is None else prefetch
+
+        page = await fetch(limit, 0)
+        for item in page['items']:
+            yield item
+
+        offsets = _page_offsets(page, limit, max_total)
+        if offsets is None or prefetch < 1:
+            offset = limit
+            while page.get('next') and (max_total is None or offset < max_total):
+                page = await fetch(limit, offset)
+                for item in page['items']:
+                    yield item
+                offset += limit
+            return
+
+        tasks = deque(asyncio.ensure_future(fetch(limit, offset)) for offset in islice(offsets, prefetch))
+        try:
+            while tasks:
+                page = await tasks.popleft()
+                for offset in islice(offsets, 1):
+                    tasks.append(asyncio.ensure_future(fetch(limit, offset)))
+                for item in page['items']:
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def iter_album_tracks(self, id: str, market: Optional[str] = None, prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.get_album_tracks(id, limit=limit, offset=offset, market=market),
+                                limit=50, prefetch=prefetch)
+
+    def iter_artist_albums(self, id: str, include_groups: Optional[str] = None, market: Optional[str] = None,
+                           prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.get_artist_albums(id, include_groups=include_groups, market=market,
+                                                                             limit=limit, offset=offset),
+                                limit=50, prefetch=prefetch)
+
+    def iter_playlist_tracks(self, id: str, fields: Optional[str] = None, market: Optional[str] = None,
+                             prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.playlist_tracks(id, fields=fields, limit=limit, offset=offset,
+                                                                           market=market),
+                                limit=100, prefetch=prefetch)
+
+    def iter_category_playlists(self, category_id: str, country: Optional[str] = None, prefetch: Optional[int] = None):
+        async def fetch(limit, offset):
+            return (await self.category_playlists(category_id, limit=limit, offset=offset, country=country))['playlists']
+        return self._iter_pages(fetch, limit=50, prefetch=prefetch)
+
+    def iter_categories(self, country: Optional[str] = None, locale: Optional[str] = None, prefetch: Optional[int] = None):
+        async def fetch(limit, offset):
+            return (await self.list_categories(limit=limit, offset=offset, country=country, locale=locale))['categories']
+        return self._iter_pages(fetch, limit=50, prefetch=prefetch)
+
+    def iter_featured_playlists(self, locale: Optional[str] = None, country: Optional[str] = None,
+                                timestamp: Optional[str] = None, prefetch: Optional[int] = None):
+        async def fetch(limit, offset):
+            return (await self.featured_playlists(locale=locale, country=country, timestamp=timestamp,
+                                                  limit=limit, offset=offset))['playlists']
+        return self._iter_pages(fetch, limit=50, prefetch=prefetch)
+
+    def iter_new_releases(self, country: Optional[str] = None, prefetch: Optional[int] = None):
+        return self._iter_pages(lambda limit, offset: self.get_new_releases(country=country, limit=limit, offset=offset),
+                                limit=50, prefetch=prefetch)
+
+    def iter_search(self, q: str, type: str, market: Optional[str] = None, include_external: bool = False,
+                    prefetch: Optional[int] = None):
+        async def fetch(limit, offset):
+            return (await self.search(q, type, market=market, limit=limit, offset=offset,
+                                      include_external=include_external))[type + "s"]
+        return self._iter_pages(fetch, limit=50, prefetch=prefetch, max_total=1000)
@@ -0,0 +1,202 @@
+'''
+typed records for the fast decode path of SimpleSpotifyApi (fast_decode=True), needs msgspec
+
+responses are decoded straight into these structs instead of dicts. fields that aren't declared (available_markets
+is the big one) are skipped by the decoder without ever being built. records can be indexed like the dicts they
+replace (record['id'], 'followers' in record, record.get('popularity')) so the user classes work with either.
+optional fields are UNSET when spotify leaves them out, which is how the simplified forms are told apart
+'''
+from typing import *
+import msgspec
+from msgspec import UNSET, UnsetType
+
+T = TypeVar("T")
+
+
+class Record(msgspec.Struct, gc=False):
+    ''' a struct that can also be read like a dict '''
+
+    def __getitem__(self, key):
+        value = getattr(self, key, UNSET)
+        if value is UNSET:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return getattr(self, key, UNSET) is not UNSET
+
+    def get(self, key, default=None):
+        value = getattr(self, key, UNSET)
+        return default if value is UNSET else value
+
+    def keys(self) -> list:
+        return [field for field in self.__struct_fields__ if getattr(self, field) is not UNSET]
+
+    def items(self) -> list:
+        return [(field, getattr(self, field)) for field in self.keys()]
+
+
+class ExternalUrls(Record):
+    spotify: str = ""
+
+
+class Image(Record):
+    url: str
+    height: Optional[int] = None
+    width: Optional[int] = None
+
+
+class Followers(Record):
+    total: int = 0
+
+
+class Paging(Record, Generic[T]):
+    items: List[T]
+    total: Optional[int] = None
+    limit: int = 0
+    offset: int = 0
+    href: Optional[str] = None
+    next: Optional[str] = None
+    previous: Optional[str] = None
+
+
+class Artist(Record):
+    id: str
+    name: str
+    uri: str
+    href: str
+    type: str
+    external_urls: ExternalUrls
+    # full form only
+    followers: Union[Followers, UnsetType] = UNSET
+    genres: Union[List[str], UnsetType] = UNSET
+    images: Union[List[Image], UnsetType] = UNSET
+    popularity: Union[int, UnsetType] = UNSET
+
+
+class Album(Record):
+    id: str
+    name: str
+    uri: str
+    href: str
+    type: str
+    external_urls: ExternalUrls
+    album_type: str
+    artists: List[Artist]
+    images: List[Image]
+    release_date: str
+    release_date_precision: str
+    total_tracks: Union[int, UnsetType] = UNSET
+    album_group: Union[str, UnsetType] = UNSET
+    # full form only
+    copyrights: Union[List[Dict[str, str]], UnsetType] = UNSET
+    external_ids: Union[Dict[str, str], UnsetType] = UNSET
+    genres: Union[List[str], UnsetType] = UNSET
+    label: Union[str, UnsetType] = UNSET
+    popularity: Union[int, UnsetType] = UNSET
+    tracks: Union["Paging[Track]", UnsetType] = UNSET
+
+
+class Track(Record):
+    id: Optional[str]  # local files have no id
+    name: str
+    uri: str
+    href: Optional[str]
+    type: str
+    external_urls: ExternalUrls
+    artists: List[Artist]
+    disc_number: int
+    duration_ms: int
+    explicit: bool
+    is_local: bool = False
+    preview_url: Optional[str] = None
+    track_number: int = 0
+    # full form only
+    album: Union[Album, UnsetType] = UNSET
+    popularity: Union[int, UnsetType] = UNSET
+    external_ids: Union[Dict[str, str], UnsetType] = UNSET
+
+
+class Playlist(Record):
+    id: str
+    name: str
+    uri: str
+    href: str
+    type: str
+    external_urls: ExternalUrls
+    collaborative: bool
+    images: List[Image]
+    owner: Dict[str, Any]
+    public: Optional[bool]
+    snapshot_id: str
+    tracks: Dict[str, Any]  # {"href", "total"} on simplified playlists, a page of playlist tracks on full ones
+    description: Union[Optional[str], UnsetType] = UNSET
+    followers: Union[Followers, UnsetType] = UNSET
+
+
+class AudioFeatures(Record):
+    id: str
+    uri: str
+    type: str
+    track_href: str
+    analysis_url: str
+    acousticness: float
+    danceability: float
+    duration_ms: int
+    energy: float
+    instrumentalness: float
+    key: int
+    liveness: float
+    loudness: float
+    mode: int
+    speechiness: float
+    tempo: float
+    time_signature: int
+    valence: float
+
+
+class MultipleAlbums(Record):
+    albums: List[Optional[Album]]
+
+
+class MultipleArtists(Record):
+    artists: List[Optional[Artist]]
+
+
+class MultipleTracks(Record):
+    tracks: List[Optional[Track]]
+
+
+class MultipleAudioFeatures(Record):
+    audio_features: List[Optional[AudioFeatures]]
+
+
+class NewReleases(Record):
+    albums: Paging[Album]
+
+
+class TopTracks(Record):
+    tracks: List[Track]
+
+
+class RelatedArtists(Record):
+    artists: List[Artist]
+
+
+# what each kind of response decodes into, SimpleSpotifyApi._decode picks by kind
+decoders = {
+    "album": msgspec.json.Decoder(Album),
+    "artist": msgspec.json.Decoder(Artist),
+    "track": msgspec.json.Decoder(Track),
+    "playlist": msgspec.json.Decoder(Playlist),
+    "audio_features": msgspec.json.Decoder(AudioFeatures),
+    "album_page": msgspec.json.Decoder(Paging[Album]),
+    "track_page": msgspec.json.Decoder(Paging[Track]),
+    "multiple_albums": msgspec.json.Decoder(MultipleAlbums),
+    "multiple_artists": msgspec.json.Decoder(MultipleArtists),
+    "multiple_tracks": msgspec.json.Decoder(MultipleTracks),
+    "multiple_audio_features": msgspec.json.Decoder(MultipleAudioFeatures),
+    "new_releases": msgspec.json.Decoder(NewReleases),
+    "top_tracks": msgspec.json.Decoder(TopTracks),
+    "related_artists": msgspec.json.Decoder(RelatedArtists),
+}
@@ -0,0 +1,544 @@
+'''
+a stand-in for the spotify web api you can run locally, for load tests and benchmarks that can't hit the real one
+
+    with FakeSpotifyServer(FakeCatalog.synthetic(artists=500), latency=0.02, rate_limit=200) as server:
+        client = simplespotify.Client("id", "secret", **server.urls)
+        ...
+
+it serves the /v1 routes SimpleSpotifyApi uses and the accounts routes the token bearers use (/api/token, and
+/authorize which redirects straight back with a code). responses are built from a FakeCatalog, either a synthetic
+one or one saved from real responses, and page, filter (playlist fields) and report unknown ids the way spotify
+does. latency, throttling (429 + Retry-After), server errors and ETags are configurable per route
+'''
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import *
+from .api import multiple_limits
+from .IDtools import format_id
+
+
+# what the simplified form of each object leaves out
+_full_only = {
+    "artist": ("followers", "genres", "images", "popularity"),
+    "album": ("copyrights", "external_ids", "genres", "label", "popularity", "tracks"),
+    "track": ("album", "popularity", "external_ids"),
+}
+
+_genres = ("indie rock", "emo", "shoegaze", "ska punk", "bedroom pop", "math rock", "post-hardcore", "dream pop")
+_words = ("the", "music", "industry", "bomb", "summer", "night", "glass", "river", "ghost", "static", "paper",
+          "light", "motion", "echo", "north", "garden", "signal", "youth", "weather", "island")
+
+
+def _fake_id(rng: random.Random) -> str:
+    # a random 128 bit number like real ids, not just any 22 base62 characters, so SpotifyID takes them
+    return format_id(rng.getrandbits(128))
+
+
+def _simplify(kind: str, obj: dict) -> dict:
+    return {key: value for key, value in obj.items() if key not in _full_only.get(kind, ())}
+
+
+class FakeCatalog:
+    '''
+    everything the fake server knows about, as the full objects spotify would return. albums and playlists keep
+    their tracks as id lists (album_tracks, playlist_tracks) and the server builds the pages from them.
+    FakeCatalog.synthetic() makes one up, save()/load() keep one around (e.g. filled from recorded responses)
+    '''
+
+    _tables = ("artists", "albums", "tracks", "playlists", "audio_features", "related", "artist_albums",
+               "album_tracks", "playlist_tracks")
+
+    def __init__(self, artists=None, albums=None, tracks=None, playlists=None, audio_features=None, related=None,
+                 artist_albums=None, album_tracks=None, playlist_tracks=None):
+        self.artists: Dict[str, dict] = artists or {}
+        self.albums: Dict[str, dict] = albums or {}
+        self.tracks: Dict[str, dict] = tracks or {}
+        self.playlists: Dict[str, dict] = playlists or {}
+        self.audio_features: Dict[str, dict] = audio_features or {}
+        self.related: Dict[str, list] = related or {}  # artist id -> related artist ids
+        self.artist_albums: Dict[str, list] = artist_albums or {}  # artist id -> album ids
+        self.album_tracks: Dict[str, list] = album_tracks or {}  # album id -> track ids
+        self.playlist_tracks: Dict[str, list] = playlist_tracks or {}  # playlist id -> track ids
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({table: getattr(self, table) for table in self._tables}, f)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    @classmethod
+    def synthetic(cls, artists: int = 200, albums_per_artist: int = 5, max_album_tracks: int = 60,
+                  playlists: int = 20, max_playlist_tracks: int = 500, related_per_artist: int = 20, seed: int = 0):
+        ''' a made up catalog, the same seed always gives the same one. some albums are longer than one page '''
+        rng = random.Random(seed)
+        catalog = cls()
+
+        def name(words=2):
+            return " ".join(rng.choice(_words) for _ in range(words)).title()
+
+        def base(kind, id, title):
+            return {"external_urls": {"spotify": f"https://open.spotify.com/{kind}/{id}"},
+                    "href": f"https://api.spotify.com/v1/{kind}s/{id}", "id": id, "name": title,
+                    "type": kind, "uri": f"spotify:{kind}:{id}"}
+
+        def images(id):
+            return [{"url": f"https://i.scdn.co/image/{id}", "height": size, "width": size} for size in (640, 300, 64)]
+
+        for _ in range(artists):
+            id = _fake_id(rng)
+            catalog.artists[id] = dict(base("artist", id, name()), followers={"href": None, "total": rng.randrange(10 ** 6)},
+                                       genres=rng.sample(_genres, 2), images=images(id), popularity=rng.randrange(101))
+        artist_ids = list(catalog.artists)
+
+        for artist_id in artist_ids:
+            catalog.related[artist_id] = rng.sample(artist_ids, min(related_per_artist, len(artist_ids) - 1))
+            catalog.artist_albums[artist_id] = []
+            for _ in range(albums_per_artist):
+                album_id = _fake_id(rng)
+                artist = [_simplify("artist", catalog.artists[artist_id])]
+                total = rng.randint(1, max_album_tracks)
+                year = rng.randint(1970, 2023)
+                album = dict(base("album", album_id, name(3)), album_type=rng.choice(("album", "single", "compilation")),
+                             artists=artist, images=images(album_id), release_date=str(year),
+                             release_date_precision="year", total_tracks=total, available_markets=["US", "GB", "DE"],
+                             copyrights=[{"text": f"{year} {artist[0]['name']}", "type": "C"}],
+                             external_ids={"upc": str(rng.randrange(10 ** 12))}, genres=[], label=name(1) + " Records",
+                             popularity=rng.randrange(101))
+                catalog.albums[album_id] = album
+                catalog.artist_albums[artist_id].append(album_id)
+                catalog.album_tracks[album_id] = []
+                for number in range(1, total + 1):
+                    track_id = _fake_id(rng)
+                    catalog.tracks[track_id] = dict(
+                        base("track", track_id, name(rng.randint(1, 4))), artists=artist, album=_simplify("album", album),
+                        disc_number=1, duration_ms=rng.randint(60000, 420000), explicit=rng.random() < 0.1,
+                        preview_url=None, track_number=number, is_local=False, popularity=rng.randrange(101),
+                        external_ids={"isrc": "US" + str(rng.randrange(10 ** 10))}, available_markets=["US", "GB", "DE"])
+                    catalog.album_tracks[album_id].append(track_id)
+                    catalog.audio_features[track_id] = {
+                        "id": track_id, "uri": f"spotify:track:{track_id}", "type": "audio_features",
+                        "track_href": f"https://api.spotify.com/v1/tracks/{track_id}",
+                        "analysis_url": f"https://api.spotify.com/v1/audio-analysis/{track_id}",
+                        "acousticness": rng.random(), "danceability": rng.random(), "energy": rng.random(),
+                        "instrumentalness": rng.random(), "liveness": rng.random(), "speechiness": rng.random(),
+                        "valence": rng.random(), "loudness": rng.uniform(-30, 0), "tempo": rng.uniform(60, 200),
+                        "key": rng.randrange(12), "mode": rng.randrange(2), "time_signature": rng.choice((3, 4, 4, 4)),
+                        "duration_ms": catalog.tracks[track_id]["duration_ms"]}
+
+        track_ids = list(catalog.tracks)
+        for _ in range(playlists):
+            id = _fake_id(rng)
+            catalog.playlists[id] = dict(base("playlist", id, name(3)), collaborative=False, description=name(6),
+                                         followers={"href": None, "total": rng.randrange(10 ** 5)}, images=images(id),
+                                         owner={"display_name": "fake", "id": "fake", "type": "user",
+                                                "uri": "spotify:user:fake", "href": "https://api.spotify.com/v1/users/fake",
+                                                "external_urls": {"spotify": "https://open.spotify.com/user/fake"}},
+                                         public=True, snapshot_id=_fake_id(rng))
+            catalog.playlist_tracks[id] = rng.sample(track_ids, min(rng.randint(1, max_playlist_tracks), len(track_ids)))
+        return catalog
+
+
+def _parse_fields(text: str, i: int = 0) -> Tuple[dict, int]:
+    ''' spotify's fields syntax ("name,tracks.total,items(track(name))") as a tree of {key: subtree or None} '''
+    tree, name = {}, ""
+
+    def add(path, subtree):
+        node = tree
+        keys = path.split(".")
+        for key in keys[:-1]:
+            if node.get(key, {}) is None:
+                return
+            node = node.setdefault(key, {})
+        if keys[-1] not in node or subtree is None:
+            node[keys[-1]] = subtree
+        elif node[keys[-1]] is not None:
+            node[keys[-1]].update(subtree)
+
+    while i < len(text):
+        char = text[i]
+        if char == "(":
+            subtree, i = _parse_fields(text, i + 1)
+            add(name.strip(), subtree)
+            name = ""
+            continue
+        if char == ")":
+            if name.strip():
+                add(name.strip(), None)
+            return tree, i + 1
+        if char == ",":
+            if name.strip():
+                add(name.strip(), None)
+            name = ""
+        else:
+            name += char
+        i += 1
+    if name.strip():
+        add(name.strip(), None)
+    return tree, i
+
+
+def _project(value, tree: Optional[dict]):
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+class _Reply(Exception):
+    ''' raised by a route to answer with an error '''
+
+    def __init__(self, status: int, message: str, headers: Optional[dict] = None):
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class FakeSpotifyServer:
+    '''
+    serves a FakeCatalog on 127.0.0.1 from a background thread, start()/stop() or use it as a context manager
+
+        latency      - seconds added to every response, or {route: seconds} with "default" for the rest
+        rate_limit   - requests per second before answering 429 with Retry-After, None for no limit
+        throttle_rate- chance of a 429 regardless of rate, float or {route: chance}
+        error_rate   - chance of a 500/502/503, float or {route: chance}
+        retry_after  - seconds sent in Retry-After
+        etags        - send ETags and answer If-None-Match with 304
+        require_auth - answer 401 to api requests without a bearer token
+        token_expires_in - lifetime of the tokens /api/token hands out
+    routes are named like the path with ids left out: "tracks", "tracks/{id}", "albums/{id}/tracks", "search",
+    "api/token"... stats counts requests per route and status
+    '''
+
+    def __init__(self, catalog: Optional[FakeCatalog] = None, port: int = 0, latency: Union[float, dict] = 0,
+                 rate_limit: Optional[float] = None, throttle_rate: Union[float, dict] = 0,
+                 error_rate: Union[float, dict] = 0, retry_after: int = 1, etags: bool = True,
+                 require_auth: bool = True, token_expires_in: int = 3600, seed: int = 0):
+        self.catalog = catalog if catalog is not None else FakeCatalog.synthetic(seed=seed)
+        self.port = port
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.etags = etags
+        self.require_auth = require_auth
+        self.token_expires_in = token_expires_in
+        self.stats = Counter()  # (route, status) -> requests
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = deque()  # times of the requests in the last second, for rate_limit
+        self._httpd = None
+        self._thread = None
+        self._routes = [(re.compile("^" + re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", pattern) + "$"), pattern, handler)
+                        for pattern, handler in self._route_table()]
+
+    # -- lifecycle --
+    def start(self):
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self._httpd = _HTTPServer(("127.0.0.1", self.port), Handler)
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-spotify", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def accounts_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def urls(self) -> dict:
+        ''' keyword arguments that point a Client/Oauth2 (simplespotify.auth) at this server '''
+        return {"base_url": self.base_url, "accounts_url": self.accounts_url}
+
+    # -- behaviour --
+    @staticmethod
+    def _setting(value, route: str):
+        if isinstance(value, dict):
+            return value.get(route, value.get("default", 0))
+        return value
+
+    def _misbehave(self, route: str):
+        ''' sleeps and raises the 429s and 5xx this server is configured for '''
+        delay = self._setting(self.latency, route)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                while self._recent and self._recent[0] < now - 1:
+                    self._recent.popleft()
+                if len(self._recent) >= self.rate_limit:
+                    raise _Reply(429, "API rate limit exceeded", {"Retry-After": str(self.retry_after)})
+                self._recent.append(now)
+            roll = self._rng.random()
+            error = self._rng.choice((500, 502, 503))
+        throttle = self._setting(self.throttle_rate, route)
+        if roll < throttle:
+            raise _Reply(429, "API rate limit exceeded", {"Retry-After": str(self.retry_after)})
+        if roll < throttle + self._setting(self.error_rate, route):
+            raise _Reply(error, "Server error")
+
+    # -- request handling --
+    def handle(self, method: str, path: str, query: dict, headers, body: bytes) -> Tuple[int, dict, bytes]:
+        ''' (status, headers, body) for one request '''
+        parsed = path[len("/v1"):] if path.startswith("/v1/") else path
+        for regex, route, handler in self._routes:
+            match = regex.match(parsed)
+            if match is not None and (route == "/api/token") == (method == "POST"):
+                break
+        else:
+            return self._error(404, "Service not found")
+        route = route.lstrip("/")
+        try:
+            self._misbehave(route)
+            if self.require_auth and path.startswith("/v1/") and \
+                    not headers.get("Authorization", "").startswith("Bearer "):
+                raise _Reply(401, "No token provided")
+            result = handler(self, query=query, body=body, **match.groupdict())
+        except _Reply as reply:
+            status, extra, content = self._error(reply.status, reply.message, reply.headers)
+        else:
+            if isinstance(result, tuple):  # (status, headers) for redirects
+                status, extra, content = result[0], result[1], b""
+            else:
+                status, extra, content = 200, {"Content-Type": "application/json"}, json.dumps(result).encode()
+                if self.etags:
+                    etag = '"' + hashlib.md5(content).hexdigest() + '"'
+                    extra["ETag"] = etag
+                    if headers.get("If-None-Match") == etag:
+                        status, content = 304, b""
+        with self._lock:
+            self.stats[(route, status)] += 1
+        return status, extra, content
+
+    @staticmethod
+    def _error(status: int, message: str, headers: Optional[dict] = None):
+        content = json.dumps({"error": {"status": status, "message": message}}).encode()
+        return status, dict(headers or {}, **{"Content-Type": "application/json"}), content
+
+    # -- helpers for the routes --
+    @staticmethod
+    def _int(query: dict, key: str, default: int, maximum: Optional[int] = None) -> int:
+        try:
+            value = int(query.get(key, default))
+        except ValueError:
+            raise _Reply(400, f"Invalid {key}")
+        if value < 0 or (maximum is not None and value > maximum):
+            raise _Reply(400, f"Invalid {key}")
+        return value
+
+    def _page(self, items: list, query: dict, path: str, max_limit: int = 50, default_limit: int = 20) -> dict:
+        limit = self._int(query, "limit", default_limit, max_limit)
+        offset = self._int(query, "offset", 0)
+
+        def url(at):
+            return f"{self.base_url}{path}?" + urllib.parse.urlencode(dict(query, offset=at, limit=limit))
+
+        return {"href": url(offset), "items": items[offset:offset + limit], "limit": limit,
+                "next": url(offset + limit) if offset + limit < len(items) else None, "offset": offset,
+                "previous": url(max(offset - limit, 0)) if offset > 0 else None, "total": len(items)}
+
+    def _one(self, table: dict, id: str, kind: str) -> dict:
+        if id not in table:
+            raise _Reply(404, "non existing id") if re.fullmatch(r"[0-9A-Za-z]{22}", id) else _Reply(400, "invalid id")
+        return table[id]
+
+    def _many(self, table: dict, query: dict, key: str) -> dict:
+        ids = [id for id in query.get("ids", "").split(",") if id]
+        if not ids:
+            raise _Reply(400, "invalid ids")
+        if len(ids) > multiple_limits[key]:
+            raise _Reply(400, "Too many ids requested")
+        return {key: [table.get(id) for id in ids]}
+
+    def _album(self, id: str, query: dict) -> dict:
+        album = dict(self._one(self.catalog.albums, id, "album"))
+        album["tracks"] = self._page(self._album_tracks(id), {}, f"/albums/{id}/tracks", default_limit=50)
+        return album
+
+    def _album_tracks(self, id: str) -> list:
+        return [_simplify("track", self.catalog.tracks[track_id]) for track_id in self.catalog.album_tracks.get(id, ())]
+
+    def _playlist_items(self, id: str) -> list:
+        return [{"added_at": "2020-01-01T00:00:00Z", "added_by": None, "is_local": False,
+                 "track": self.catalog.tracks[track_id]} for track_id in self.catalog.playlist_tracks.get(id, ())]
+
+    def _simple_playlist(self, playlist: dict) -> dict:
+        return dict(_simplify("playlist", {k: v for k, v in playlist.items() if k != "followers"}),
+                    tracks={"href": f"{self.base_url}/playlists/{playlist['id']}/tracks",
+                            "total": len(self.catalog.playlist_tracks.get(playlist['id'], ()))})
+
+    # -- routes --
+    def _route_table(self):
+        return [
+            ("/tracks", lambda s, query, body: s._many(s.catalog.tracks, query, "tracks")),
+            ("/tracks/{id}", lambda s, query, body, id: s._one(s.catalog.tracks, id, "track")),
+            ("/albums", lambda s, query, body: {"albums": [s._album(id, query) if album is not None else None for id, album in
+                                                           zip(query.get("ids", "").split(","),
+                                                               s._many(s.catalog.albums, query, "albums")["albums"])]}),
+            ("/albums/{id}", lambda s, query, body, id: s._album(id, query)),
+            ("/albums/{id}/tracks", lambda s, query, body, id: s._page(
+                s._album_tracks(s._one(s.catalog.albums, id, "album")["id"]), query, f"/albums/{id}/tracks")),
+            ("/artists", lambda s, query, body: s._many(s.catalog.artists, query, "artists")),
+            ("/artists/{id}", lambda s, query, body, id: s._one(s.catalog.artists, id, "artist")),
+            ("/artists/{id}/albums", lambda s, query, body, id: s._page(
+                [_simplify("album", s.catalog.albums[album_id])
+                 for album_id in s.catalog.artist_albums.get(s._one(s.catalog.artists, id, "artist")["id"], ())
+                 if query.get("include_groups") is None
+                 or s.catalog.albums[album_id]["album_type"] in query["include_groups"].split(",")],
+                query, f"/artists/{id}/albums")),
+            ("/artists/{id}/top-tracks", lambda s, query, body, id: {"tracks": sorted(
+                (s.catalog.tracks[track_id] for album_id in s.catalog.artist_albums.get(id, ())
+                 for track_id in s.catalog.album_tracks[album_id]),
+                key=lambda track: -track["popularity"])[:10]}),
+            ("/artists/{id}/related-artists", lambda s, query, body, id: {"artists": [
+                s.catalog.artists[artist_id] for artist_id in s.catalog.related.get(s._one(s.catalog.artists, id, "artist")["id"], ())]}),
+            ("/audio-features", lambda s, query, body: s._many(s.catalog.audio_features, query, "audio_features")),
+            ("/audio-features/{id}", lambda s, query, body, id: s._one(s.catalog.audio_features, id, "audio_features")),
+            ("/audio-analysis/{id}", lambda s, query, body, id: s._audio_analysis(id)),
+            ("/playlists/{id}", lambda s, query, body, id: _project(
+                dict(s._one(s.catalog.playlists, id, "playlist"),
+                     tracks=s._page(s._playlist_items(id), {}, f"/playlists/{id}/tracks", max_limit=100,
+                                    default_limit=100)),
+                _parse_fields(query["fields"])[0] if query.get("fields") else None)),
+            ("/playlists/{id}/tracks", lambda s, query, body, id: _project(
+                s._page(s._playlist_items(s._one(s.catalog.playlists, id, "playlist")["id"]),
+                        {k: v for k, v in query.items() if k != "fields"}, f"/playlists/{id}/tracks",
+                        max_limit=100, default_limit=100),
+                _parse_fields(query["fields"])[0] if query.get("fields") else None)),
+            ("/playlists/{id}/images", lambda s, query, body, id: s._one(s.catalog.playlists, id, "playlist")["images"]),
+            ("/search", lambda s, query, body: s._search(query)),
+            ("/recommendations", lambda s, query, body: {"seeds": [], "tracks": s._rng.sample(
+                list(s.catalog.tracks.values()), min(s._int(query, "limit", 20, 100), len(s.catalog.tracks)))}),
+            ("/browse/new-releases", lambda s, query, body: {"albums": s._page(
+                [_simplify("album", album) for album in s.catalog.albums.values()], query, "/browse/new-releases")}),
+            ("/browse/featured-playlists", lambda s, query, body: {"message": "Featured", "playlists": s._page(
+                [s._simple_playlist(playlist) for playlist in s.catalog.playlists.values()], query,
+                "/browse/featured-playlists")}),
+            ("/browse/categories", lambda s, query, body: {"categories": s._page(
+                [{"id": genre.replace(" ", ""), "name": genre, "icons": [], "href": ""} for genre in _genres], query,
+                "/browse/categories")}),
+            ("/browse/categories/{id}", lambda s, query, body, id: {"id": id, "name": id, "icons": [], "href": ""}),
+            ("/browse/categories/{id}/playlists", lambda s, query, body, id: {"playlists": s._page(
+                [s._simple_playlist(playlist) for playlist in s.catalog.playlists.values()], query,
+                f"/browse/categories/{id}/playlists")}),
+            ("/authorize", lambda s, query, body: (302, {"Location": query.get("redirect_uri", "/") + "?" + urllib.parse.urlencode(
+                {key: value for key, value in (("code", "fake-code"), ("state", query.get("state"))) if value})})),
+            ("/api/token", lambda s, query, body: s._token(body)),
+        ]
+
+    def _audio_analysis(self, id: str) -> dict:
+        features = self._one(self.catalog.audio_features, id, "audio_features")
+        rng = random.Random(id)
+        duration = features["duration_ms"] / 1000
+        beats = [{"start": i * 0.5, "duration": 0.5, "confidence": rng.random()} for i in range(int(duration * 2))]
+        return {"meta": {"analyzer_version": "fake"},
+                "track": {"duration": duration, "tempo": features["tempo"], "key": features["key"],
+                          "mode": features["mode"], "loudness": features["loudness"],
+                          "time_signature": features["time_signature"]},
+                "bars": beats[::4], "beats": beats, "tatums": beats,
+                "sections": [{"start": 0.0, "duration": duration, "confidence": 1.0, "loudness": features["loudness"],
+                              "tempo": features["tempo"], "key": features["key"], "mode": features["mode"]}],
+                "segments": [dict(beat, loudness_start=-20.0, loudness_max=-10.0, loudness_max_time=0.1,
+                                  pitches=[rng.random() for _ in range(12)], timbre=[rng.uniform(-50, 50) for _ in range(12)])
+                             for beat in beats]}
+
+    def _search(self, query: dict) -> dict:
+        q = query.get("q", "")
+        # "track:name" style filters are matched on the name like everything else
+        words = [word.split(":", 1)[-1].lower() for word in q.split()]
+        tables = {"track": self.catalog.tracks, "album": self.catalog.albums, "artist": self.catalog.artists,
+                  "playlist": self.catalog.playlists}
+        results = {}
+        for kind in query.get("type", "").split(","):
+            if kind not in tables:
+                raise _Reply(400, "Bad search type field")
+            found = [obj for obj in tables[kind].values() if all(word in obj["name"].lower() for word in words)]
+            found = [self._simple_playlist(obj) if kind == "playlist" else _simplify(kind, obj) if kind != "track" else obj
+                     for obj in found]
+            results[kind + "s"] = self._page(found, query, "/search")
+        return results
+
+    def _token(self, body: bytes) -> dict:
+        form = dict(urllib.parse.parse_qsl(body.decode()))
+        grant = form.get("grant_type")
+        if grant not in ("client_credentials", "authorization_code", "refresh_token"):
+            raise _Reply(400, "unsupported_grant_type")
+        token = {"access_token": "fake-" + _fake_id(random.Random(time.monotonic_ns())), "token_type": "Bearer",
+                 "expires_in": self.token_expires_in}
+        if grant == "authorization_code":
+            token["refresh_token"] = "fake-refresh"
+        return token
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients hanging up (a streamed response that wasn't read to the end...) aren't worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake: FakeSpotifyServer = None
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real thing
+
+    def _respond(self, method: str):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status, headers, content = self.fake.handle(method, url.path, query, self.headers, body)
+        if status >= 400 and url.path == "/api/token":
+            # the accounts service reports errors differently from the web api
+            content = json.dumps({"error": "invalid_request",
+                                  "error_description": json.loads(content)["error"]["message"]}).encode()
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def log_message(self, format, *args):
+        pass
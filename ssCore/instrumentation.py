@@ -0,0 +1,278 @@
+import threading
+import time
+import urllib.parse
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+from typing import *
+from .IDtools import is_id
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # only needed for OpenTelemetryInstrumentation
+    otel_trace = None
+
+
+class _NullSpan:
+    def set_attribute(self, key: str, value):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class Instrumentation:
+    '''
+    what SimpleSpotifyApi, the token bearers and the object caches report to. this base class ignores everything
+    and has enabled = False, which the hot paths check before timing anything so leaving it off costs next to
+    nothing. subclass it and override what you need, or use StatsRecorder / SpanRecorder /
+    OpenTelemetryInstrumentation below, then set_default_instrumentation(...) or pass it to SimpleSpotifyApi
+        endpoint - the path with ids replaced, "/playlists/{id}/tracks"
+        attempt  - 0 for the first try of a request, 1.. for the scheduler's retries
+        cache    - "Track.ids", "Track.names", "Track.searches"... names and searches are the search cache
+    '''
+
+    enabled = False
+
+    def on_request(self, endpoint: str, status: int, seconds: float, nbytes: int, attempt: int):
+        pass
+
+    def on_token_refresh(self, bearer: str, seconds: float):
+        pass
+
+    def on_cache(self, cache: str, hit: bool):
+        pass
+
+    def span(self, name: str, attributes: Optional[dict] = None):
+        ''' context manager around a whole request (retries included), yields something with set_attribute '''
+        return nullcontext(_null_span)
+
+
+# upper bounds in seconds, the last bucket catches everything slower
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class _EndpointStats:
+    __slots__ = ("requests", "retries", "bytes", "statuses", "latency_sum", "latency_counts")
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.bytes = 0
+        self.statuses = Counter()
+        self.latency_sum = 0.0
+        self.latency_counts = [0] * len(latency_buckets)
+
+    def quantile(self, q: float) -> Optional[float]:
+        ''' upper bound of the bucket the q-th quantile falls in '''
+        rank = q * self.requests
+        seen = 0
+        for bound, count in zip(latency_buckets, self.latency_counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self) -> dict:
+        return {"requests": self.requests, "retries": self.retries, "bytes": self.bytes,
+                "statuses": dict(self.statuses),
+                "latency": {"sum": self.latency_sum,
+                            "mean": self.latency_sum / self.requests if self.requests else None,
+                            "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99),
+                            "buckets": {str(bound): count for bound, count in zip(latency_buckets, self.latency_counts)}}}
+
+
+class StatsRecorder(Instrumentation):
+    '''
+    in process counters, snapshot() gives per endpoint request counts, retries, bytes, status codes and latency
+    histograms (see latency_buckets), token refresh counts and times per bearer, and cache hits and misses
+
+        stats = StatsRecorder()
+        set_default_instrumentation(stats)
+        ...
+        stats.snapshot()["requests"]["/tracks"]["latency"]["p95"]
+    '''
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._refreshes = {}
+            self._caches = {}
+
+    def on_request(self, endpoint, status, seconds, nbytes, attempt):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = _EndpointStats()
+            stats.requests += 1
+            stats.retries += attempt > 0
+            stats.bytes += nbytes
+            stats.statuses[status] += 1
+            stats.latency_sum += seconds
+            stats.latency_counts[bisect_left(latency_buckets, seconds)] += 1
+
+    def on_token_refresh(self, bearer, seconds):
+        with self._lock:
+            count, total = self._refreshes.get(bearer, (0, 0.0))
+            self._refreshes[bearer] = (count + 1, total + seconds)
+
+    def on_cache(self, cache, hit):
+        with self._lock:
+            counts = self._caches.get(cache)
+            if counts is None:
+                counts = self._caches[cache] = [0, 0]
+            counts[0 if hit else 1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"requests": {endpoint: stats.snapshot() for endpoint, stats in self._endpoints.items()},
+                    "token_refreshes": {bearer: {"count": count, "seconds": total}
+                                        for bearer, (count, total) in self._refreshes.items()},
+                    "caches": {cache: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+                               for cache, (hits, misses) in self._caches.items()}}
+
+
+class Span:
+    ''' a finished (or running) span as SpanRecorder keeps them, times are time.time() seconds '''
+
+    __slots__ = ("name", "attributes", "start", "end", "error")
+
+    def __init__(self, name: str, attributes: Optional[dict] = None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "start": self.start, "end": self.end, "duration": self.duration,
+                "attributes": self.attributes, "error": self.error}
+
+    def __repr__(self):
+        return f"<Span {self.name} {self.duration}s {self.attributes}>"
+
+
+class SpanRecorder(Instrumentation):
+    ''' keeps the last maxlen request spans in memory, on_finish(span) is called as each one ends (to export them) '''
+
+    enabled = True
+
+    def __init__(self, maxlen: int = 10000, on_finish: Optional[Callable] = None):
+        self.spans = deque(maxlen=maxlen)
+        self.on_finish = on_finish
+
+    @contextmanager
+    def span(self, name, attributes=None):
+        span = Span(name, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.end = time.time()
+            self.spans.append(span)
+            if self.on_finish is not None:
+                self.on_finish(span)
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    ''' one OpenTelemetry span per request, needs opentelemetry-api. uses the global tracer provider if no tracer is given '''
+
+    enabled = True
+
+    def __init__(self, tracer=None):
+        if otel_trace is None:
+            raise ImportError("OpenTelemetryInstrumentation requires opentelemetry-api to be installed")
+        self.tracer = tracer if tracer is not None else otel_trace.get_tracer("simplespotify")
+
+    def span(self, name, attributes=None):
+        return self.tracer.start_as_current_span(name, attributes=attributes)
+
+
+class MultiInstrumentation(Instrumentation):
+    ''' reports to several at once, MultiInstrumentation(StatsRecorder(), OpenTelemetryInstrumentation()) '''
+
+    def __init__(self, *instrumentations: Instrumentation):
+        self.instrumentations = [instrumentation for instrumentation in instrumentations if instrumentation.enabled]
+        self.enabled = bool(self.instrumentations)
+
+    def on_request(self, endpoint, status, seconds, nbytes, attempt):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_request(endpoint, status, seconds, nbytes, attempt)
+
+    def on_token_refresh(self, bearer, seconds):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_token_refresh(bearer, seconds)
+
+    def on_cache(self, cache, hit):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_cache(cache, hit)
+
+    @contextmanager
+    def span(self, name, attributes=None):
+        spans = [instrumentation.span(name, attributes) for instrumentation in self.instrumentations]
+        entered = []
+        try:
+            for span in spans:
+                entered.append(span.__enter__())
+            yield _MultiSpan(entered)
+        except BaseException as e:
+            for span in reversed(spans[:len(entered)]):
+                span.__exit__(type(e), e, e.__traceback__)
+            raise
+        else:
+            for span in reversed(spans):
+                span.__exit__(None, None, None)
+
+
+class _MultiSpan:
+    def __init__(self, spans: list):
+        self.spans = spans
+
+    def set_attribute(self, key, value):
+        for span in self.spans:
+            span.set_attribute(key, value)
+
+
+def endpoint_name(url: str, base_url: str = "") -> str:
+    ''' the url's path relative to base_url with ids swapped for {id} so requests group by endpoint '''
+    if base_url and url.startswith(base_url):
+        path = url[len(base_url):]
+    else:
+        path = urllib.parse.urlsplit(url).path
+    return "/".join("{id}" if is_id(part) else part for part in path.split("/"))
+
+
+def response_size(r, stream: bool = False) -> int:
+    ''' bytes received, streamed bodies aren't read here so they count by their Content-Length '''
+    if stream:
+        return int(r.headers.get("Content-Length") or 0)
+    return len(r.content)
+
+
+_default_instrumentation = Instrumentation()
+
+
+def default_instrumentation() -> Instrumentation:
+    ''' what everything reports to unless a SimpleSpotifyApi was given its own, does nothing by default '''
+    return _default_instrumentation
+
+
+def set_default_instrumentation(instrumentation: Optional[Instrumentation]):
+    ''' set_default_instrumentation(StatsRecorder()), None turns it back off '''
+    global _default_instrumentation
+    _default_instrumentation = instrumentation if instrumentation is not None else Instrumentation()
@@ -0,0 +1,211 @@
+import abc
+import json
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict, namedtuple
+from typing import *
+
+# what we keep for every response, body is the raw bytes spotify sent
+CacheEntry = namedtuple("CacheEntry", ["body", "etag", "stored_at"])
+
+
+class CachedResponse:
+    ''' stands in for a requests.Response when the body came out of the cache '''
+
+    def __init__(self, body: bytes, status_code: int = 200, headers: Optional[dict] = None):
+        self.content = body
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+class CacheStore(abc.ABC):
+    ''' where ResponseCache keeps its entries, implement get/set/clear to plug in something else '''
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[CacheEntry]:
+        pass
+
+    @abc.abstractmethod
+    def set(self, key: str, entry: CacheEntry):
+        pass
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+
+class LRUStore(CacheStore):
+    ''' in process, least recently used entries are dropped once there are more than maxsize '''
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteStore(CacheStore):
+    ''' on disk so the cache survives restarts, safe to share between threads and processes '''
+
+    def __init__(self, path: str = "simplespotify_cache.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses "
+                           "(key TEXT PRIMARY KEY, body BLOB, etag TEXT, stored_at REAL)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT body, etag, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return CacheEntry(*row) if row is not None else None
+
+    def set(self, key, entry):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                               (key, entry.body, entry.etag, entry.stored_at))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def prune(self, older_than: float):
+        ''' deletes everything stored more than older_than seconds ago '''
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - older_than,))
+
+
+class TieredStore(CacheStore):
+    ''' memory in front of disk, disk hits are copied into memory '''
+
+    def __init__(self, memory: Optional[CacheStore] = None, disk: Optional[CacheStore] = None):
+        self.memory = memory if memory is not None else LRUStore()
+        self.disk = disk if disk is not None else SQLiteStore()
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self.memory.set(key, entry)
+        self.disk.set(key, entry)
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.clear()
+
+
+DAY = 24 * 60 * 60
+
+# (regex on the url path, seconds an entry is fresh), first match wins. 0 means never cached
+default_ttls = (
+    (r"/v1/audio-features", 365 * DAY),     # never changes
+    (r"/v1/audio-analysis", 365 * DAY),
+    (r"/v1/browse/new-releases", 60 * 60),  # short lived
+    (r"/v1/browse/", 6 * 60 * 60),
+    (r"/v1/recommendations", 0),
+    (r"/v1/search", 60 * 60),
+    (r"/v1/artists/[^/]+/(top-tracks|related-artists|albums)", DAY),
+    (r"/v1/artists", 7 * DAY),
+    (r"/v1/albums", 7 * DAY),
+    (r"/v1/tracks", 7 * DAY),
+    (r"/v1/playlists", 0),                  # can be private to whoever is logged in
+    (r"/v1/me", 0),
+)
+
+
+class ResponseCache:
+    '''
+    HTTP cache for SimpleSpotifyApi._get. responses are keyed on url + normalized params and stay fresh for the
+    ttl of their endpoint, after that they're revalidated with If-None-Match so an unchanged one costs a 304
+    '''
+
+    def __init__(self, store: Optional[CacheStore] = None, ttls: Iterable = default_ttls, default_ttl: float = 0):
+        self.store = store if store is not None else LRUStore()
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str, params: Optional[dict] = None) -> str:
+        if not params:
+            return url
+        params = sorted((k, str(v)) for k, v in params.items() if v is not None)
+        return url + "?" + urllib.parse.urlencode(params)
+
+    def ttl(self, url: str) -> float:
+        path = urllib.parse.urlsplit(url).path
+        for pattern, ttl in self.ttls:
+            if pattern.match(path):
+                return ttl
+        return self.default_ttl
+
+    def _count(self, stat: str):
+        with self._lock:
+            setattr(self, stat, getattr(self, stat) + 1)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations}
+
+    def get(self, url: str, params: Optional[dict], send: Callable):
+        ''' send(url, params, headers) does the actual request and has to pass 304s through '''
+        ttl = self.ttl(url)
+        if ttl <= 0:
+            return send(url, params)
+
+        key = self.key(url, params)
+        entry = self.store.get(key)
+        now = time.time()
+        if entry is not None and now - entry.stored_at < ttl:
+            self._count("hits")
+            return CachedResponse(entry.body)
+
+        headers = {"If-None-Match": entry.etag} if entry is not None and entry.etag else None
+        r = send(url, params, headers)
+
+        if r.status_code == 304 and entry is not None:
+            self._count("revalidations")
+            self.store.set(key, entry._replace(stored_at=now))
+            return CachedResponse(entry.body)
+
+        self._count("misses")
+        if r.status_code == 200:
+            self.store.set(key, CacheEntry(r.content, r.headers.get("ETag"), now))
+        return r
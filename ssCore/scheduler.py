@@ -0,0 +1,157 @@
+import asyncio
+import random
+import threading
+import time
+from typing import *
+
+
+class TokenBucket:
+    ''' token bucket shared by every thread using the same api, rate=None only enforces Retry-After pauses '''
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else (rate or 1)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        ''' nobody gets a token for the next `seconds`, used when spotify sends Retry-After '''
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            # nothing refills during the pause, otherwise the first acquire after it would get a whole burst
+            self._last = self._paused_until
+
+    def _take(self) -> float:
+        ''' takes a token and returns 0, or returns how long to wait before trying again '''
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.rate is None:
+                return 0
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while (wait := self._take()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while (wait := self._take()) > 0:
+            await asyncio.sleep(wait)
+
+
+class AIMDLimiter:
+    '''
+    caps how many requests are in flight at once. the cap grows by about one per round of successful requests
+    and is cut by `decrease` on a 429 or 5xx, so it hovers just under whatever spotify is willing to take
+    '''
+
+    def __init__(self, initial: float = 8, minimum: float = 1, maximum: float = 64, decrease: float = 0.5,
+                 cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.cooldown = cooldown  # a burst of 429s only counts as one cut
+        self._in_flight = 0
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            before = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            if int(self.limit) > before:
+                self._cond.notify()
+
+    def on_throttle(self):
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_cut < self.cooldown:
+                return
+            self._last_cut = now
+            self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+class RequestScheduler:
+    '''
+    everything SimpleSpotifyApi sends goes through here, it waits for the token bucket and the concurrency
+    limiter, retries 429s after Retry-After and 5xx with jittered exponential backoff
+    '''
+
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None,
+                 limiter: Optional[AIMDLimiter] = None, max_retries: int = 5,
+                 backoff_base: float = 0.5, backoff_cap: float = 30.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = limiter if limiter is not None else AIMDLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter" so retrying threads don't all come back at the same moment
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _retry_delay(self, status: int, headers, attempt: int) -> float:
+        if status == 429:
+            try:
+                retry_after = float(headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                retry_after = self._backoff(attempt)
+            # everybody waits out the Retry-After, a little jitter spreads them out when it's over
+            self.bucket.pause(retry_after)
+            return retry_after + random.uniform(0, self.backoff_base)
+        return self._backoff(attempt)
+
+    def send(self, request: Callable):
+        ''' calls request() until it gets something that isn't worth retrying, returns the last response '''
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            with self.limiter:
+                r = request()
+
+            if r.status_code not in self.retry_statuses:
+                self.limiter.on_success()
+                return r
+
+            self.limiter.on_throttle()
+            if attempt == self.max_retries:
+                break
+            time.sleep(self._retry_delay(r.status_code, r.headers, attempt))
+        return r
+
+    async def send_async(self, request: Callable):
+        '''
+        send() for AsyncSimpleSpotifyApi, request is a coroutine function returning an aiohttp response. the
+        limiter is left out, it blocks the thread and aiohttp's connector already caps the requests in flight
+        '''
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire_async()
+            r = await request()
+
+            if r.status not in self.retry_statuses or attempt == self.max_retries:
+                return r
+            await asyncio.sleep(self._retry_delay(r.status, r.headers, attempt))
+        return r
@@ -3,23 +3,119 @@ import os
 import base64
 import time
 import abc
+import threading
+import asyncio
 import urllib.parse
 from.ssexceptions import *
+from .tokenstore import TokenStore, token_key
+from .transport import default_transport
+from .scheduler import RequestScheduler
+from .instrumentation import default_instrumentation
 
 
 
-def token_expired(tokeninfo):
-    return tokeninfo['expires_at'] < int(time.time()) + 60
+default_accounts_url = "https://accounts.spotify.com"
+
+
+# token requests get the same Retry-After / backoff treatment as api requests, shared since they all go to accounts
+_token_scheduler = RequestScheduler()
+
+
+def _post_token(session, url: str, data: dict, headers: dict):
+    ''' posts a token request, retrying 429s and 5xx, raises for anything but a 200 or a 400 '''
+    resp = _token_scheduler.send(lambda: session.post(url=url, data=data, headers=headers))
+    if resp.status_code not in (200, 400):
+        resp.raise_for_status()
+    return resp
+
+
+def _report_refresh(bearer, start: float):
+    ''' tells the bearer's api's instrumentation (or the default one) how long getting a token took '''
+    api = getattr(bearer, "api", None)
+    instrumentation = api.instrumentation if api is not None else default_instrumentation()
+    if instrumentation.enabled:
+        instrumentation.on_token_refresh(type(bearer).__name__, time.perf_counter() - start)
+
+
+def token_expired(tokeninfo, margin=60):
+    return tokeninfo['expires_at'] < int(time.time()) + margin
 
 def add_token_expiration_date(tokeninfo):
     tokeninfo['expires_at'] = int(time.time()) + tokeninfo['expires_in']
 
 
+class TokenRefresher:
+    '''
+    refreshes a bearer's token `margin` seconds before it expires so requests never have to wait for one.
+    bearers need a refresh(margin) method and a _current_tokeninfo() method
+    '''
+
+    def __init__(self, bearer, margin: int = 300, retry: int = 30):
+        self.bearer = bearer
+        self.margin = margin
+        self.retry = retry  # seconds to wait after a failed refresh (or while there's no token to refresh)
+        self._stop = threading.Event()
+        self._thread = None
+        self._task = None
+
+    def _wait_time(self) -> float:
+        tokeninfo = self.bearer._current_tokeninfo()
+        if tokeninfo is None:
+            return 0
+        return tokeninfo['expires_at'] - self.margin - time.time()
+
+    def _refresh(self) -> bool:
+        try:
+            self.bearer.refresh(margin=self.margin)
+            return True
+        except Exception:
+            return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self._wait_time()
+            if wait > 0:
+                self._stop.wait(wait)
+            elif not self._refresh():
+                self._stop.wait(self.retry)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="simplespotify-token-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def start_async(self) -> asyncio.Task:
+        self._task = asyncio.get_running_loop().create_task(self.run_async())
+        return self._task
+
+    def stop(self):
+        self._stop.set()
+        task = self._task
+        if task is not None and not task.done() and not task.get_loop().is_closed():
+            # stop() can be called from any thread, the task may be sleeping for most of an hour
+            task.get_loop().call_soon_threadsafe(task.cancel)
+
+    async def run_async(self):
+        ''' the same loop as an asyncio task, refreshes run in the default executor so the loop isn't blocked '''
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            wait = self._wait_time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            elif not await loop.run_in_executor(None, self._refresh):
+                await asyncio.sleep(self.retry)
+
+
 class TokenBearer(abc.ABC) :
     @abc.abstractmethod
     def _get_token(self):
         pass
 
+    async def _get_token_async(self):
+        ''' _get_token for the event loop, run in the default executor since it may have to block on a refresh '''
+        return await asyncio.get_running_loop().run_in_executor(None, self._get_token)
+
     @classmethod
     def __subclasshook__(cls,subcls) :
         if "_get_token" in subcls.__dict__ and callable(subcls.__dict__["_get_token"]):
@@ -35,11 +131,14 @@ class DirectTokenBearer(TokenBearer):
     def __init__(self, token, makesession=True):
         self.token = token
         if makesession:
-            self._session = requests.session()
+            self._session = default_transport()
 
     def _get_token(self):
         return self.token
 
+    async def _get_token_async(self):
+        return self.token
+
 
 class Oauth2(TokenBearer):
 
@@ -47,15 +146,16 @@ class Oauth2(TokenBearer):
     def _session(self):
         if self._passed_session is not None:
             return self._passed_session
-        if not hasattr(self, "_session_"):
-            self._session_ = requests.session()
-        return self._session_
+        return default_transport()
 
     def __init__(self,client_id, client_secret, request_session=None,
                  redirecturl="http://localhost:8080", scopes = None,
-                 show_dialog = False, state = None):
+                 show_dialog = False, state = None, token_store: TokenStore = None,
+                 accounts_url: str = default_accounts_url):
 
         self._passed_session = request_session
+        self.accounts_url = accounts_url.rstrip("/")
+        self.token_store = token_store
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirecturl = redirecturl
@@ -63,6 +163,8 @@ class Oauth2(TokenBearer):
         self.show_dialog = show_dialog
         self.state = state
         self.tokeninfo = None
+        self._token_lock = threading.Lock()
+        self._refresher = None
 
     def get_redirect_uri(self) :
 
@@ -78,13 +180,13 @@ class Oauth2(TokenBearer):
 
         params = urllib.parse.urlencode(params)
 
-        return f"https://accounts.spotify.com/authorize?{params}"
+        return f"{self.accounts_url}/authorize?{params}"
 
     def exchange_code_for_token(self,code) :
         authb = base64.b64encode((self.client_id + ":" + self.client_secret).encode()).decode()
 
         resp = self._session.post(
-            url = "https://accounts.spotify.com/api/token",
+            url = f"{self.accounts_url}/api/token",
             data = {
                 'grant_type': 'authorization_code',
                 'code' : code,
@@ -96,18 +198,102 @@ class Oauth2(TokenBearer):
         if resp.status_code == 200 :
             self.tokeninfo = resp.json()
             add_token_expiration_date(self.tokeninfo)
+            if self.token_store is not None :
+                # set() rewrites the whole store, the lock keeps it from racing another process's refresh
+                with self.token_store.lock(self._token_key()):
+                    self.token_store.set(self._token_key(), self.tokeninfo)
             return self.tokeninfo # TOKEN INFO
         elif resp.status_code == 400 :
             raise Exception(f"Error 400 Bad Request : {resp.json()['error_description']}")
         resp.raise_for_status()
 
+    def _token_key(self):
+        return token_key(self.client_id, self.scopes, kind="user")
+
     def _get_token(self):
+        if self.tokeninfo is None and self.token_store is not None :
+            # another process may have authorized already
+            self.tokeninfo = self.token_store.get(self._token_key())
         if self.tokeninfo is None :
             #TODO clear up this exception
             raise Exception("No token info available!")
-        elif token_expired(self.tokeninfo):
-            pass #refresh token
-        return self.tokeninfo['access_token']
+        tokeninfo = self.tokeninfo
+        if token_expired(tokeninfo):
+            tokeninfo = self.refresh()
+        return tokeninfo['access_token']
+
+    async def _get_token_async(self):
+        tokeninfo = self.tokeninfo
+        if tokeninfo is not None and not token_expired(tokeninfo):
+            return tokeninfo['access_token']
+        return await TokenBearer._get_token_async(self)
+
+    def _current_tokeninfo(self):
+        return self.tokeninfo
+
+    def refresh(self, margin=60) -> dict:
+        ''' uses the refresh token if the access token expires within margin seconds, one thread at a time '''
+        with self._token_lock:
+            if self.tokeninfo is None and self.token_store is not None :
+                self.tokeninfo = self.token_store.get(self._token_key())
+            if self.tokeninfo is None :
+                raise Exception("No token info available!")
+            if not token_expired(self.tokeninfo, margin):
+                return self.tokeninfo
+            if self.token_store is None :
+                self.tokeninfo = self._request_refreshed_token(self.tokeninfo)
+                return self.tokeninfo
+            with self.token_store.lock(self._token_key()):
+                # another process may have refreshed it already
+                stored = self.token_store.get(self._token_key())
+                if stored is not None and not token_expired(stored, margin):
+                    self.tokeninfo = stored
+                else :
+                    self.tokeninfo = self._request_refreshed_token(stored or self.tokeninfo)
+                    self.token_store.set(self._token_key(), self.tokeninfo)
+            return self.tokeninfo
+
+    def _request_refreshed_token(self, tokeninfo):
+        start = time.perf_counter()
+        authb = base64.b64encode((self.client_id + ":" + self.client_secret).encode()).decode()
+
+        resp = _post_token(
+            self._session,
+            url = f"{self.accounts_url}/api/token",
+            data = {
+                'grant_type': 'refresh_token',
+                'refresh_token': tokeninfo['refresh_token']
+            },
+            headers = {'Authorization': f'Basic {authb}'}
+        )
+
+        if resp.status_code == 400 :
+            raise InvalidCredentials(f"Error Refreshing Token : {resp.json()['error_description']}")
+        resp.raise_for_status()
+
+        new_tokeninfo = resp.json()
+        # spotify only sometimes sends a new refresh token, the old one keeps working otherwise
+        new_tokeninfo.setdefault('refresh_token', tokeninfo['refresh_token'])
+        add_token_expiration_date(new_tokeninfo)
+        _report_refresh(self, start)
+        return new_tokeninfo
+
+    def start_background_refresh(self, margin=300):
+        ''' refreshes the token on a daemon thread margin seconds before it expires, replaces a refresher that's already running '''
+        self.stop_background_refresh()
+        self._refresher = TokenRefresher(self, margin).start()
+        return self
+
+    def start_background_refresh_async(self, margin=300) -> asyncio.Task:
+        ''' same as start_background_refresh but as a task on the running event loop '''
+        self.stop_background_refresh()
+        self._refresher = TokenRefresher(self, margin)
+        return self._refresher.start_async()
+
+    def stop_background_refresh(self):
+        if self._refresher is not None :
+            self._refresher.stop()
+            self._refresher = None
 
 
 class Client(TokenBearer):
@@ -116,39 +302,93 @@ class Client(TokenBearer):
     def session(self):
         if self._passed_session is not None:
             return self._passed_session
-        if not hasattr(self, "_session") :
-            self._session = requests.session()
-        return self._session
+        return default_transport()
 
-    def __init__(self, client_id=None, client_secret=None, requests_session=None, scope=None, redirecturl="http://localhost:8080"):
-        pass
+    def __init__(self, client_id=None, client_secret=None, requests_session=None, scope=None, redirecturl="http://localhost:8080",
+                 token_store: TokenStore = None, accounts_url: str = default_accounts_url):
         self.client_id = client_id
+        self.accounts_url = accounts_url.rstrip("/")
+        self.token_store = token_store
         self.client_secret = client_secret
         self.redirecturl = redirecturl
         self._passed_session = requests_session
         self._tokeninfo = None
+        self._token_lock = threading.Lock()
+        self._refresher = None
         self.scopes = scope
 
     def create_oauth2(self,scopes=None) -> Oauth2 :
         return Oauth2(client_id = self.client_id,client_secret = self.client_secret,
                       redirecturl=self.redirecturl, request_session = self.session,
-                      scopes=scopes or self.scopes )
+                      scopes=scopes or self.scopes, accounts_url=self.accounts_url )
 
     def _get_token(self):
-        #TODO : add token caching
-        if self._tokeninfo is None:
-            self._tokeninfo = self._request_client_token()
-        elif token_expired(self._tokeninfo):
-            self._tokeninfo = self._request_client_token()
-        return self._tokeninfo['access_token']
+        tokeninfo = self._tokeninfo
+        if tokeninfo is None or token_expired(tokeninfo):
+            tokeninfo = self.refresh()
+        return tokeninfo['access_token']
+
+    async def _get_token_async(self):
+        tokeninfo = self._tokeninfo
+        if tokeninfo is not None and not token_expired(tokeninfo):
+            return tokeninfo['access_token']
+        # refreshing blocks on the token request (and the token lock), keep it off the loop
+        return await TokenBearer._get_token_async(self)
+
+    def _current_tokeninfo(self):
+        return self._tokeninfo
+
+    def refresh(self, margin=60) -> dict:
+        ''' gets a new token if the current one expires within margin seconds '''
+        # only one thread asks for a new token, the rest wait here and use the one it got
+        with self._token_lock:
+            if self._tokeninfo is None or token_expired(self._tokeninfo, margin):
+                if self.token_store is None :
+                    self._tokeninfo = self._request_client_token()
+                else :
+                    self._tokeninfo = self._shared_client_token(margin)
+            return self._tokeninfo
+
+    def _shared_client_token(self, margin=60):
+        ''' a token from the token store, only the process holding the store's lock asks spotify for a new one '''
+        key = token_key(self.client_id, self.scopes)
+        tokeninfo = self.token_store.get(key)
+        if tokeninfo is not None and not token_expired(tokeninfo, margin):
+            return tokeninfo
+        with self.token_store.lock(key):
+            # somebody else may have refreshed it while we waited for the lock
+            tokeninfo = self.token_store.get(key)
+            if tokeninfo is None or token_expired(tokeninfo, margin):
+                tokeninfo = self._request_client_token()
+                self.token_store.set(key, tokeninfo)
+        return tokeninfo
+
+    def start_background_refresh(self, margin=300):
+        ''' gets a new token on a daemon thread margin seconds before the current one expires, replaces a refresher that's already running '''
+        self.stop_background_refresh()
+        self._refresher = TokenRefresher(self, margin).start()
+        return self
+
+    def start_background_refresh_async(self, margin=300) -> asyncio.Task:
+        ''' same as start_background_refresh but as a task on the running event loop '''
+        self.stop_background_refresh()
+        self._refresher = TokenRefresher(self, margin)
+        return self._refresher.start_async()
+
+    def stop_background_refresh(self):
+        if self._refresher is not None :
+            self._refresher.stop()
+            self._refresher = None
 
     def _request_client_token(self):
+        start = time.perf_counter()
 
         # I literally don't know what this black magic is
         authb = base64.b64encode((self.client_id + ":" + self.client_secret).encode()).decode()
 
-        resp = self.session.post(
-            url = "https://accounts.spotify.com/api/token",
+        resp = _post_token(
+            self.session,
+            url = f"{self.accounts_url}/api/token",
             data = {'grant_type': 'client_credentials'},
             headers = {'Authorization': f'Basic {authb}'}
         )
@@ -159,6 +399,7 @@ class Client(TokenBearer):
 
         tokeninfo = resp.json()
         add_token_expiration_date(tokeninfo)
+        _report_refresh(self, start)
         return tokeninfo
 
         # 'access_token', 'token_type', 'expires_in', 'scope'
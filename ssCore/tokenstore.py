@@ -0,0 +1,126 @@
+import abc
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import *
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+
+def token_key(client_id: str, scopes: Optional[str] = None, kind: str = "client") -> str:
+    ''' tokens are shared between everything using the same kind of token (client/user), client id and scopes '''
+    scopes = " ".join(sorted(scopes.split())) if scopes else ""
+    return f"{kind}:{client_id}:{scopes}"
+
+
+class TokenStore(abc.ABC):
+    '''
+    where token bearers keep their tokens so other processes can use them. lock(key) has to be exclusive across
+    processes, whoever holds it is the only one allowed to refresh that token
+    '''
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        pass
+
+    @abc.abstractmethod
+    def set(self, key: str, tokeninfo: dict):
+        pass
+
+    @abc.abstractmethod
+    def lock(self, key: str):
+        pass
+
+
+class FileTokenStore(TokenStore):
+    ''' one JSON file readable only by its owner, refreshes are serialized with an advisory lock on a second file '''
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(os.path.expanduser("~"), ".cache", "simplespotify", "tokens.json")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._thread_lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, key):
+        return self._read().get(key)
+
+    def set(self, key, tokeninfo):
+        # written to a temp file and moved into place so readers never see half a file
+        with self._thread_lock:
+            tokens = self._read()
+            tokens[key] = tokeninfo
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+            try:
+                os.chmod(tmp, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    json.dump(tokens, f)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    @contextmanager
+    def lock(self, key):
+        with open(self.path + ".lock", "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SQLiteTokenStore(TokenStore):
+    ''' sqlite database, lock() holds a write transaction so other processes wait on sqlite's own locking '''
+
+    def __init__(self, path: Optional[str] = None, timeout: float = 30):
+        self.path = path or os.path.join(os.path.expanduser("~"), ".cache", "simplespotify", "tokens.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokeninfo TEXT)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    @property
+    def _conn(self):
+        # one connection per thread, sqlite connections can't be shared between them
+        if getattr(self._local, "conn", None) is None:
+            self._local.conn = self._connect()
+        return self._local.conn
+
+    def get(self, key):
+        row = self._conn.execute("SELECT tokeninfo FROM tokens WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key, tokeninfo):
+        self._conn.execute("INSERT OR REPLACE INTO tokens VALUES (?, ?)", (key, json.dumps(tokeninfo)))
+
+    @contextmanager
+    def lock(self, key):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        finally:
+            self._conn.execute("COMMIT")
@@ -0,0 +1,123 @@
+import threading
+from typing import *
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # only needed for HttpxTransport
+    httpx = None
+
+
+class Transport:
+    '''
+    the HTTP client every api and token bearer shares unless they're given their own session. quacks like a
+    requests.Session (get/post) but sets a timeout on every request and sizes the connection pool for thread pools
+
+        pool_maxsize    - connections kept open per host, requests' default of 10 makes bigger thread pools queue
+        pool_hosts      - how many hosts get a pool (api.spotify.com, accounts.spotify.com, ...)
+        timeout         - seconds, or (connect, read) like requests
+        compression     - ask for gzip/deflate responses
+        keep_alive      - reuse connections between requests
+    '''
+
+    def __init__(self, pool_maxsize: int = 64, pool_hosts: int = 4, timeout: Union[float, tuple] = (5, 30),
+                 compression: bool = True, keep_alive: bool = True, headers: Optional[dict] = None):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate" if compression else "identity"
+        self.session.headers["Connection"] = "keep-alive" if keep_alive else "close"
+        if headers:
+            self.session.headers.update(headers)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class _ByteStream:
+    ''' file object over an httpx streaming response, what r.raw is for requests '''
+
+    def __init__(self, response):
+        self._response = response
+        self._chunks = response.iter_bytes()
+        self._buffer = b""
+        self.decode_content = True  # httpx always decodes, set by callers written for requests
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        self._response.close()
+
+
+class HttpxTransport:
+    ''' Transport on httpx, with http2=True every request to a host is multiplexed over one connection '''
+
+    def __init__(self, http2: bool = True, max_connections: int = 64, timeout: float = 30,
+                 compression: bool = True, headers: Optional[dict] = None):
+        if httpx is None:
+            raise ImportError("HttpxTransport requires httpx (and h2 for http2) to be installed")
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", "gzip, deflate" if compression else "identity")
+        self.client = httpx.Client(http2=http2, timeout=timeout, headers=headers,
+                                   limits=httpx.Limits(max_connections=max_connections,
+                                                       max_keepalive_connections=max_connections))
+
+    @staticmethod
+    def _params(params):
+        # requests drops None params, httpx would send them empty
+        return {k: v for k, v in params.items() if v is not None} if params else None
+
+    def get(self, url, params=None, headers=None, stream=False, **kwargs):
+        if not stream:
+            return self.client.get(url, params=self._params(params), headers=headers, **kwargs)
+        request = self.client.build_request("GET", url, params=self._params(params), headers=headers)
+        r = self.client.send(request, stream=True)
+        r.raw = _ByteStream(r)
+        return r
+
+    def post(self, url, data=None, headers=None, **kwargs):
+        return self.client.post(url, data=data, headers=headers, **kwargs)
+
+    def close(self):
+        self.client.close()
+
+
+_default_transport = None
+_default_lock = threading.Lock()
+
+
+def default_transport():
+    ''' the transport shared by everything that wasn't given a session, created the first time it's needed '''
+    global _default_transport
+    with _default_lock:
+        if _default_transport is None:
+            _default_transport = Transport()
+        return _default_transport
+
+
+def set_default_transport(transport):
+    ''' swaps the shared transport, e.g. set_default_transport(HttpxTransport()) before creating any clients '''
+    global _default_transport
+    with _default_lock:
+        _default_transport = transport